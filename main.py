@@ -66,20 +66,25 @@ import json
 import shutil
 import tempfile
 import threading
+import contextlib
+import queue
+import asyncio
+import random
 import time
 from datetime import datetime
 import requests
 import base64
 from io import BytesIO
 import openai
-from openai import OpenAI
+from openai import OpenAI, AsyncOpenAI
 import wave
 import uuid
 import re
 import io
 import subprocess
 import hashlib
-import pickle
+import math
+import struct
 import types
 from typing import List, Dict, Any, Optional, Tuple
 from pathlib import Path
@@ -102,6 +107,13 @@ try:
 except ImportError:
     LIBROSA_AVAILABLE = False
 
+# Local Whisper transcription runs on transformers and torch
+try:
+    import transformers
+    TRANSFORMERS_AVAILABLE = True
+except ImportError:
+    TRANSFORMERS_AVAILABLE = False
+
 # Check if pydub is available for audio conversion
 try:
     from pydub import AudioSegment
@@ -114,12 +126,18 @@ try:
     import torch
     import pyannote.audio
     from pyannote.audio.pipelines.speaker_verification import PretrainedSpeakerEmbedding
-    from pyannote.audio import Audio
     from pyannote.core import Segment, Annotation
     PYANNOTE_AVAILABLE = True
 except ImportError:
     PYANNOTE_AVAILABLE = False
 
+# ONNX Runtime can run exported diarization models instead of eager torch
+try:
+    import onnxruntime
+    ONNXRUNTIME_AVAILABLE = True
+except ImportError:
+    ONNXRUNTIME_AVAILABLE = False
+
 # Make PyAudio optional with silent failure
 try:
     import pyaudio
@@ -217,6 +235,64 @@ APP_BASE_DIR = None  # Application base directory
 app_name = "Audio Processing App"
 DEFAULT_OPENAI_MODEL = "gpt-4o-mini"
 WHISPER_MODEL = "whisper-1"
+LOCAL_WHISPER_MODEL = "openai/whisper-small"  # Hugging Face model used by the local CPU backend
+LOCAL_WHISPER_BATCH_SIZE = 8  # 30-second windows per forward pass in local transcription
+WHISPER_MAX_UPLOAD_MB = 25  # Upload limit of the OpenAI Whisper API
+WHISPER_CHUNK_SECONDS = 600  # Longest piece sent in one request when splitting long audio
+WHISPER_MAX_PARALLEL_UPLOADS = 8  # Concurrent chunk uploads for long recordings
+UPLOAD_AUDIO_BITRATE = "24k"  # Opus bitrate used for compressed uploads
+SILENCE_TRIM_MIN_SECONDS = 2.0  # Silences at least this long are cut before upload
+SILENCE_TRIM_PADDING = 0.3  # Seconds of silence kept on each side of a cut
+TRANSCRIPT_CACHE_MAX_MB = 200  # Disk budget of the transcription cache in Transcripts/
+DIARIZATION_CACHE_MAX_MB = 100  # Disk budget of the diarization cache
+DIARIZATION_CACHE_VERSION = 2  # Bump when the cached diarization format or algorithm changes
+DECODED_AUDIO_CACHE_MAX_MB = 2048  # Disk budget of converted 16 kHz WAV audio (about 115MB per hour of audio)
+BATCH_TRANSCRIBE_CONCURRENCY = 4  # Default number of simultaneous Whisper requests in batch mode
+OPENAI_REQUESTS_PER_MINUTE = 120  # Default request pacing shared by all OpenAI calls
+OPENAI_MAX_CONCURRENCY = 8  # Upper bound for simultaneous OpenAI requests
+OPENAI_MAX_RETRIES = 6  # Retries for rate-limited or transient OpenAI errors
+LIVE_SAMPLE_RATE = 16000  # Microphone sample rate for live transcription
+LIVE_RING_SECONDS = 120  # Audio kept in the live capture ring buffer
+LIVE_FRAME_SECONDS = 0.03  # Frame length used for pause detection
+LIVE_MIN_WINDOW_SECONDS = 4.0  # Live windows are cut at the first pause after this long
+LIVE_MAX_WINDOW_SECONDS = 15.0  # Live windows are cut here even without a pause
+LIVE_OVERLAP_SECONDS = 1.0  # Audio from the previous window repeated at the start of the next
+LIVE_PAUSE_SECONDS = 0.4  # Shortest quiet stretch treated as a pause
+LIVE_SILENCE_RMS = 300  # 16-bit RMS level below which a frame is always quiet
+LIVE_POLL_SECONDS = 0.25  # How often the live ring buffer is checked for a finished window
+LIVE_PROMPT_CHARS = 200  # Characters of previous live text passed to Whisper as context
+DIARIZATION_CHUNK_OVERLAP = 30  # Seconds shared by neighbouring diarization windows
+DIARIZATION_THREADS_PER_WORKER = 4  # Torch threads in each diarization worker process
+DIARIZATION_MAX_WORKERS = 8  # Each worker holds its own copy of the pipeline in memory
+DIARIZATION_WORKER_MEMORY_MB = 1500  # Resident memory of a worker process with a loaded pipeline
+DIARIZATION_MEMORY_MB_PER_CHUNK_MINUTE = 50  # Extra worker memory per minute of window audio
+DIARIZATION_MEMORY_FRACTION = 0.7  # Share of the available memory chunked diarization plans to use
+DIARIZATION_FALLBACK_MEMORY_MB = 4096  # Assumed available memory when the system can't tell
+DIARIZATION_MIN_CHUNK_SECONDS = 180  # Shortest diarization window; shorter ones cluster poorly
+DIARIZATION_MAX_CHUNK_SECONDS = 900  # Longest diarization window
+DIARIZATION_TARGET_WINDOW_SECONDS = 60  # Wall time one window should keep a worker busy
+DIARIZATION_CALIBRATION_SECONDS = 60  # Audio diarized to measure throughput on a new machine
+DIARIZATION_VAD_FRAME_SECONDS = 0.03  # Frame length of the energy voice-activity pass
+DIARIZATION_VAD_SILENCE_RMS = 300  # 16-bit RMS level below which a frame is always silent
+DIARIZATION_VAD_PADDING = 0.5  # Seconds of audio kept on both sides of detected speech
+DIARIZATION_VAD_MIN_SILENCE = 2.0  # Only silences at least this long (after padding) are skipped
+DIARIZATION_VAD_MIN_SKIPPED = 0.1  # Below this share of silence the audio is diarized as it is
+DIARIZATION_TWO_SPEAKER_MIN_OFF = 0.25  # Gaps shorter than this inside one party's speech are bridged in two-speaker mode
+DIARIZATION_BULK_ROUND_SECONDS = 1800  # Audio decoded and batched together in one round of bulk diarization
+DIARIZATION_EMBEDDING_MODEL = "pyannote/wespeaker-voxceleb-resnet34-LM"  # Speaker embeddings for label reconciliation
+DIARIZATION_EMBEDDING_TURNS = 10  # Longest turns per speaker used for the speaker's centroid
+DIARIZATION_EMBEDDING_MIN_TURN = 1.0  # Seconds; shorter turns give unreliable embeddings
+DIARIZATION_EMBEDDING_MAX_TURN = 10.0  # Seconds of each turn fed to the embedding model
+DIARIZATION_SPEAKER_SIMILARITY = 0.5  # Cosine similarity needed to treat two centroids as one speaker
+SPEAKER_LIBRARY_SIMILARITY = 0.6  # Cosine similarity needed to label a speaker with a known person's name
+DIARIZATION_PIPELINE_IDLE_SECONDS = 600  # Loaded pyannote pipelines are unloaded after this long unused
+DIARIZATION_CPU_INTRA_OP_THREADS = 0  # Torch threads inside one operation in CPU mode; 0 uses every core
+DIARIZATION_CPU_INTER_OP_THREADS = 1  # Torch threads running independent operations side by side in CPU mode
+DIARIZATION_CPU_SEGMENTATION_BATCH_SIZE = 16  # Segmentation windows per forward pass in CPU mode
+DIARIZATION_CPU_EMBEDDING_BATCH_SIZE = 8  # Embedding crops per forward pass in CPU mode (keeps activations in cache)
+DIARIZATION_ONNX_OPSET = 17  # ONNX opset of the exported segmentation and embedding models
+DIARIZATION_ONNX_TOLERANCE = 1e-3  # Largest difference from torch an exported model may show
+SUPPORTED_AUDIO_FORMATS = ['.flac', '.m4a', '.mp3', '.mp4', '.mpeg', '.mpga', '.oga', '.ogg', '.wav', '.webm']
 client = None  # OpenAI client instance
 
 # Disable GUI requirement check for wxPython
@@ -227,7 +303,8 @@ os.environ['WXSUPPRESS_APP_NAME_WARNING'] = '1'
 DIARIZATION_AVAILABLE = False
 try:
     from pyannote.audio import Pipeline
-    from pyannote.core import Segment, Timeline, Annotation
+    from pyannote.audio.utils.signal import binarize
+    from pyannote.core import Segment, Timeline, Annotation, SlidingWindow, SlidingWindowFeature
     import torch
     DIARIZATION_AVAILABLE = True
 except ImportError:
@@ -240,26 +317,27 @@ def run_cli():
     print("\n========= AI Assistant (CLI Mode) =========")
     print("1. Set OpenAI API Key")
     print("2. Transcribe Audio")
-    print("3. Chat with AI")
-    print("4. Exit")
+    print("3. Batch Transcribe Files or Folder")
+    print("4. Chat with AI")
+    print("5. Exit")
     
     api_key = os.environ.get("OPENAI_API_KEY", "")
     client = None
     if api_key:
         try:
-            client = OpenAI(api_key=api_key)
+            client = OpenAI(api_key=api_key, max_retries=0)
             print("OpenAI API Key found in environment.")
         except Exception as e:
             print(f"Error initializing OpenAI client: {e}")
     
     while True:
-        choice = input("\nEnter your choice (1-4): ")
+        choice = input("\nEnter your choice (1-5): ")
         
         if choice == "1":
             api_key = input("Enter your OpenAI API Key: ").strip()
             os.environ["OPENAI_API_KEY"] = api_key
             try:
-                client = OpenAI(api_key=api_key)
+                client = OpenAI(api_key=api_key, max_retries=0)
                 print("API Key set successfully.")
             except Exception as e:
                 print(f"Error setting API key: {e}")
@@ -277,7 +355,8 @@ def run_cli():
             print("Transcribing audio...")
             try:
                 with open(audio_path, "rb") as audio_file:
-                    response = client.audio.transcriptions.create(
+                    response = openai_scheduler.call(
+                        client.audio.transcriptions.create,
                         file=audio_file,
                         model="whisper-1"
                     )
@@ -291,6 +370,29 @@ def run_cli():
             if not client:
                 print("Please set your OpenAI API Key first (option 1).")
                 continue
+            
+            paths = [p.strip() for p in input("Enter audio files or a folder (comma separated): ").split(",") if p.strip()]
+            files = BatchTranscriber.collect_audio_files(paths)
+            if not files:
+                print("No supported audio files found.")
+                continue
+            
+            def print_progress(path, status, detail=None):
+                message = f"[{status}] {os.path.basename(path)}"
+                if status == "error":
+                    message += f": {detail}"
+                print(message)
+            
+            print(f"Transcribing {len(files)} files...")
+            batch = BatchTranscriber(api_key, AudioProcessor(client), progress_callback=print_progress)
+            results = batch.run(files)
+            done = sum(1 for result in results.values() if not isinstance(result, Exception))
+            print(f"Batch complete: {done}/{len(files)} files transcribed. Transcripts saved to {batch.output_dir}")
+        
+        elif choice == "4":
+            if not client:
+                print("Please set your OpenAI API Key first (option 1).")
+                continue
                 
             print("\nChat with AI (type 'exit' to end conversation)")
             chat_history = []
@@ -303,7 +405,8 @@ def run_cli():
                 chat_history.append({"role": "user", "content": user_input})
                 
                 try:
-                    response = client.chat.completions.create(
+                    response = openai_scheduler.call(
+                        client.chat.completions.create,
                         model="gpt-4o",
                         messages=chat_history,
                         temperature=0.7,
@@ -317,36 +420,2134 @@ def run_cli():
                 except Exception as e:
                     print(f"Error: {e}")
         
-        elif choice == "4":
+        elif choice == "5":
             print("Exiting AI Assistant. Goodbye!")
             break
             
         else:
-            print("Invalid choice. Please enter a number between 1 and 4.")
+            print("Invalid choice. Please enter a number between 1 and 5.")
+
+
+def main():
+    # Check if we're running in CLI mode explicitly
+    if "--cli" in sys.argv:
+        run_cli()
+        return 0
+    
+    # Check if wxPython is available
+    if not WX_AVAILABLE:
+        print("wxPython is not available. Running in CLI mode.")
+        run_cli()
+        return 0
+    
+    # Try to run in GUI mode
+    try:
+        app = MainApp()
+        app.MainLoop()
+        return 0
+    except Exception as e:
+        print(f"Error starting application: {e}")
+        print("Falling back to CLI mode.")
+        run_cli()
+        return 1
+
+class RequestScheduler:
+    """
+    Shared gate for all OpenAI requests.
+    
+    Requests are paced with a token bucket and limited to an adaptive number in
+    flight. A 429 halves the concurrency limit and pauses everyone for the
+    server's Retry-After; successes grow the limit back slowly (AIMD). Rate
+    limits, timeouts, connection errors and 5xx responses are retried with
+    jittered exponential backoff, so they turn into delays instead of failures.
+    """
+    def __init__(self, requests_per_minute=OPENAI_REQUESTS_PER_MINUTE, max_concurrency=OPENAI_MAX_CONCURRENCY,
+                 max_retries=OPENAI_MAX_RETRIES, base_delay=1.0, max_delay=60.0):
+        self._lock = threading.Condition()
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.active = 0
+        self._paused_until = 0.0
+        self.configure(requests_per_minute, max_concurrency)
+    
+    def configure(self, requests_per_minute=None, max_concurrency=None):
+        """Update the request rate and concurrency ceiling."""
+        with self._lock:
+            if requests_per_minute:
+                self.rate = requests_per_minute / 60.0
+                self.burst = max(1.0, min(requests_per_minute / 6.0, 20.0))
+                self.tokens = self.burst
+                self._last_refill = time.monotonic()
+            if max_concurrency:
+                self.max_concurrency = max(1, int(max_concurrency))
+                self.concurrency_limit = float(self.max_concurrency)
+            self._lock.notify_all()
+    
+    def call(self, func, *args, **kwargs):
+        """Run a blocking OpenAI call through the scheduler, retrying transient failures."""
+        for attempt in range(self.max_retries + 1):
+            while True:
+                wait = self._try_acquire()
+                if wait is None:
+                    break
+                with self._lock:
+                    self._lock.wait(wait)
+            
+            # The slot is released however the call ends, including KeyboardInterrupt
+            try:
+                self._rewind_files(args, kwargs)
+                result = func(*args, **kwargs)
+            except Exception as e:
+                delay = self._on_failure(e, attempt)
+                if delay is None:
+                    raise
+            else:
+                self._on_success()
+                return result
+            finally:
+                self._release()
+            time.sleep(delay)
+    
+    async def acall(self, func, *args, **kwargs):
+        """Run an async OpenAI call through the scheduler, retrying transient failures."""
+        for attempt in range(self.max_retries + 1):
+            while True:
+                wait = self._try_acquire()
+                if wait is None:
+                    break
+                await asyncio.sleep(wait)
+            
+            # The slot is released however the call ends, including a cancelled task
+            try:
+                self._rewind_files(args, kwargs)
+                result = await func(*args, **kwargs)
+            except Exception as e:
+                delay = self._on_failure(e, attempt)
+                if delay is None:
+                    raise
+            else:
+                self._on_success()
+                return result
+            finally:
+                self._release()
+            await asyncio.sleep(delay)
+    
+    def _try_acquire(self):
+        """Take a slot and a token if both are free; otherwise return how long to wait."""
+        with self._lock:
+            now = time.monotonic()
+            if now < self._paused_until:
+                return self._paused_until - now
+            if self.active >= int(self.concurrency_limit):
+                return 0.05
+            
+            # Refill the token bucket
+            self.tokens = min(self.burst, self.tokens + (now - self._last_refill) * self.rate)
+            self._last_refill = now
+            if self.tokens < 1.0:
+                return (1.0 - self.tokens) / self.rate
+            
+            self.tokens -= 1.0
+            self.active += 1
+            return None
+    
+    def _release(self):
+        """Give back the slot taken by _try_acquire."""
+        with self._lock:
+            self.active -= 1
+            self._lock.notify_all()
+    
+    def _on_success(self):
+        """Grow the concurrency limit additively."""
+        with self._lock:
+            self.concurrency_limit = min(self.max_concurrency, self.concurrency_limit + 1.0 / self.concurrency_limit)
+    
+    def _on_failure(self, error, attempt):
+        """Shrink the limit on rate limiting and return the delay before retrying, or None if the error is final."""
+        rate_limited = isinstance(error, openai.RateLimitError)
+        retryable = rate_limited or isinstance(error, (
+            openai.APIConnectionError,  # Includes timeouts
+            openai.InternalServerError
+        ))
+        retry_after = self._retry_after(error)
+        
+        if rate_limited:
+            with self._lock:
+                # Back off multiplicatively and hold everyone until the server's Retry-After
+                self.concurrency_limit = max(1.0, self.concurrency_limit / 2)
+                self.tokens = 0.0
+                if retry_after:
+                    self._paused_until = max(self._paused_until, time.monotonic() + retry_after)
+        
+        if not retryable or attempt >= self.max_retries:
+            return None
+        
+        backoff = random.uniform(0, min(self.max_delay, self.base_delay * (2 ** attempt)))
+        return max(retry_after or 0.0, backoff)
+    
+    def _retry_after(self, error):
+        """Read the server's Retry-After hint in seconds from an API error, if any."""
+        response = getattr(error, "response", None)
+        headers = getattr(response, "headers", None)
+        if not headers:
+            return None
+        
+        try:
+            if headers.get("retry-after-ms"):
+                return float(headers["retry-after-ms"]) / 1000.0
+            retry_after = headers.get("retry-after")
+            if not retry_after:
+                return None
+            try:
+                return float(retry_after)
+            except ValueError:
+                # HTTP-date format
+                from email.utils import parsedate_to_datetime
+                return max(0.0, parsedate_to_datetime(retry_after).timestamp() - time.time())
+        except Exception:
+            return None
+    
+    def _rewind_files(self, args, kwargs):
+        """Seek file arguments back to the start so a retry uploads the whole file again."""
+        for value in list(args) + list(kwargs.values()):
+            if hasattr(value, "seek") and hasattr(value, "read"):
+                try:
+                    value.seek(0)
+                except Exception:
+                    pass
+
+# Every OpenAI request in the application goes through this scheduler
+openai_scheduler = RequestScheduler()
+
+_content_hash_memo = {}
+_content_hash_lock = threading.Lock()
+
+def file_content_hash(path):
+    """Return the SHA-256 of a file's content, memoized by path, size and modification time."""
+    stat = os.stat(path)
+    memo_key = (os.path.realpath(path), stat.st_size, stat.st_mtime_ns)
+    
+    with _content_hash_lock:
+        if memo_key in _content_hash_memo:
+            return _content_hash_memo[memo_key]
+    
+    sha = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            sha.update(block)
+    digest = sha.hexdigest()
+    
+    with _content_hash_lock:
+        _content_hash_memo[memo_key] = digest
+    return digest
+
+class TranscriptionCache:
+    """Persistent cache of Whisper responses keyed by audio content and request options."""
+    def __init__(self, cache_dir=None, max_bytes=TRANSCRIPT_CACHE_MAX_MB * 1024 * 1024):
+        if cache_dir is None:
+            # Use APP_BASE_DIR if available
+            if APP_BASE_DIR:
+                cache_dir = os.path.join(APP_BASE_DIR, "Transcripts", "cache")
+            else:
+                cache_dir = os.path.join("Transcripts", "cache")
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+    
+    def make_key(self, audio_path, language=None, model=WHISPER_MODEL, granularities=None):
+        """Build the cache key from the audio content hash and the transcription options."""
+        parts = [
+            file_content_hash(audio_path),
+            language or "auto",
+            model,
+            ",".join(sorted(granularities)) if granularities else "text"
+        ]
+        return hashlib.sha256("|".join(parts).encode("utf-8")).hexdigest()
+    
+    def get(self, key):
+        """Return the cached response for a key, or None if it isn't cached."""
+        from openai.types.audio import Transcription, TranscriptionVerbose
+        
+        entry_path = os.path.join(self.cache_dir, f"{key}.json")
+        try:
+            with open(entry_path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return None
+        
+        # Touch the entry so eviction treats it as recently used
+        try:
+            os.utime(entry_path, None)
+        except OSError:
+            pass
+        
+        if "duration" in data:
+            return TranscriptionVerbose.model_validate(data)
+        return Transcription.model_validate(data)
+    
+    def put(self, key, response):
+        """Store a response (including words and segments) and evict old entries over the size limit."""
+        data = response.model_dump() if hasattr(response, "model_dump") else {"text": str(response)}
+        
+        try:
+            with self._lock:
+                os.makedirs(self.cache_dir, exist_ok=True)
+                entry_path = os.path.join(self.cache_dir, f"{key}.json")
+                temp_path = f"{entry_path}.{uuid.uuid4().hex}.tmp"
+                with open(temp_path, "w", encoding="utf-8") as f:
+                    json.dump(data, f, ensure_ascii=False)
+                os.replace(temp_path, entry_path)
+                self._evict()
+        except Exception as e:
+            # Caching is an optimization, never fail the transcription because of it
+            print(f"Error saving transcript to cache: {e}")
+    
+    def _evict(self):
+        """Delete least recently used entries until the cache fits in its byte budget."""
+        entries = []
+        for filename in os.listdir(self.cache_dir):
+            if filename.endswith(".json"):
+                entry_path = os.path.join(self.cache_dir, filename)
+                stat = os.stat(entry_path)
+                entries.append((stat.st_mtime, stat.st_size, entry_path))
+        
+        total_size = sum(size for _, size, _ in entries)
+        for _, size, entry_path in sorted(entries):
+            if total_size <= self.max_bytes:
+                break
+            os.unlink(entry_path)
+            total_size -= size
+
+class DiarizationCache:
+    """
+    Persistent cache of diarization results stored as compact arrays.
+    
+    Keys combine the audio content hash with the pipeline model and every parameter
+    that affects the result, so renamed or copied files still hit and changed
+    settings miss. Each entry is an uncompressed .npz file holding start, end and
+    speaker index arrays plus the label names; loading it needs no pickle. Whole-file
+    runs also keep their segmentation scores and speaker embeddings, so the speakers
+    can be re-clustered without running the models again.
+    """
+    def __init__(self, cache_dir=None, max_bytes=DIARIZATION_CACHE_MAX_MB * 1024 * 1024):
+        if cache_dir is None:
+            # Use APP_BASE_DIR if available
+            if APP_BASE_DIR:
+                cache_dir = os.path.join(APP_BASE_DIR, "diarization_cache")
+            else:
+                cache_dir = "diarization_cache"
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+    
+    def make_key(self, audio_path, model, params=None):
+        """Build the cache key from the audio content hash, pipeline model and parameters."""
+        parts = [
+            f"v{DIARIZATION_CACHE_VERSION}",
+            file_content_hash(audio_path),
+            model,
+            json.dumps(params or {}, sort_keys=True, default=str)
+        ]
+        return hashlib.sha256("|".join(parts).encode("utf-8")).hexdigest()
+    
+    def get(self, key):
+        """Return the cached Annotation for a key, or None if it isn't cached."""
+        data = self._load(f"{key}.npz")
+        if data is None:
+            return None
+        
+        starts, ends, speakers, labels = data["starts"], data["ends"], data["speakers"], data["labels"]
+        annotation = Annotation()
+        for track, (start, end, speaker) in enumerate(zip(starts.tolist(), ends.tolist(), speakers.tolist())):
+            annotation[Segment(start, end), track] = str(labels[speaker])
+        return annotation
+    
+    def put(self, key, annotation):
+        """Store an Annotation and evict old entries over the size limit."""
+        labels = sorted(annotation.labels())
+        index = {label: i for i, label in enumerate(labels)}
+        tracks = list(annotation.itertracks(yield_label=True))
+        
+        self._store(f"{key}.npz", {
+            "starts": np.array([segment.start for segment, _, _ in tracks], dtype=np.float64),
+            "ends": np.array([segment.end for segment, _, _ in tracks], dtype=np.float64),
+            "speakers": np.array([index[label] for _, _, label in tracks], dtype=np.int32),
+            "labels": np.array([str(label) for label in labels], dtype=np.str_)
+        })
+    
+    def make_session_key(self, audio_path, model, params=None):
+        """Build the key of a recording's incremental diarization state from its path, so it survives appended audio."""
+        parts = [
+            f"v{DIARIZATION_CACHE_VERSION}",
+            "session",
+            os.path.abspath(audio_path),
+            model,
+            json.dumps(params or {}, sort_keys=True, default=str)
+        ]
+        return hashlib.sha256("|".join(parts).encode("utf-8")).hexdigest()
+    
+    def get_state(self, key):
+        """Return the incremental diarization state stored by put_state, or None."""
+        data = self._load(f"{key}.state.npz")
+        if data is None:
+            return None
+        
+        sums = [None if row.size == 0 or np.isnan(row).any() else row for row in data["sums"]]
+        return {
+            "turns": list(zip(data["starts"].tolist(), data["ends"].tolist(), data["speakers"].tolist())),
+            "sums": sums,
+            "until": float(data["until"]),
+            "overlap": float(data.get("overlap", DIARIZATION_CHUNK_OVERLAP)),
+            "fingerprint": str(data["fingerprint"])
+        }
+    
+    def put_state(self, key, state):
+        """Store the state of a chunked diarization so a longer version of the recording can continue it."""
+        dimension = next((len(total) for total in state["sums"] if total is not None), 0)
+        sums = np.full((len(state["sums"]), dimension), np.nan, dtype=np.float32)
+        for index, total in enumerate(state["sums"]):
+            if total is not None:
+                sums[index] = total
+        
+        self._store(f"{key}.state.npz", {
+            "starts": np.array([start for start, _, _ in state["turns"]], dtype=np.float64),
+            "ends": np.array([end for _, end, _ in state["turns"]], dtype=np.float64),
+            "speakers": np.array([speaker for _, _, speaker in state["turns"]], dtype=np.int32),
+            "sums": sums,
+            "until": np.float64(state["until"]),
+            "overlap": np.float64(state["overlap"]),
+            "fingerprint": np.array(state["fingerprint"])
+        })
+    
+    def get_features(self, key):
+        """Return the cached segmentation scores, speaker counts and embeddings for a key, or None."""
+        return self._load(f"{key}.features.npz")
+    
+    def put_features(self, key, features):
+        """Store the arrays captured by _run_diarization so the result can be re-clustered later."""
+        self._store(f"{key}.features.npz", features)
+    
+    def _load(self, filename):
+        """Read a cache entry into a dict of arrays, or return None if it is missing or stale."""
+        entry_path = os.path.join(self.cache_dir, filename)
+        try:
+            with np.load(entry_path, allow_pickle=False) as data:
+                if int(data["version"]) != DIARIZATION_CACHE_VERSION:
+                    return None
+                arrays = {name: data[name] for name in data.files if name != "version"}
+        except (OSError, KeyError, ValueError):
+            return None
+        
+        # Touch the entry so eviction treats it as recently used
+        try:
+            os.utime(entry_path, None)
+        except OSError:
+            pass
+        return arrays
+    
+    def _store(self, filename, arrays):
+        """Atomically write a dict of arrays as a cache entry."""
+        try:
+            with self._lock:
+                os.makedirs(self.cache_dir, exist_ok=True)
+                entry_path = os.path.join(self.cache_dir, filename)
+                temp_path = f"{entry_path}.{uuid.uuid4().hex}.tmp"
+                with open(temp_path, "wb") as f:
+                    np.savez(f, version=np.int32(DIARIZATION_CACHE_VERSION), **arrays)
+                os.replace(temp_path, entry_path)
+                self._evict()
+        except Exception as e:
+            # Caching is an optimization, never fail the diarization because of it
+            print(f"Error saving diarization to cache: {e}")
+    
+    def _evict(self):
+        """Delete least recently used entries until the cache fits in its byte budget."""
+        entries = []
+        for filename in os.listdir(self.cache_dir):
+            if filename.endswith(".npz"):
+                entry_path = os.path.join(self.cache_dir, filename)
+                stat = os.stat(entry_path)
+                entries.append((stat.st_mtime, stat.st_size, entry_path))
+        
+        total_size = sum(size for _, size, _ in entries)
+        for _, size, entry_path in sorted(entries):
+            if total_size <= self.max_bytes:
+                break
+            os.unlink(entry_path)
+            total_size -= size
+
+# Guards conversions into the decoded-audio cache
+_audio_cache_lock = threading.Lock()
+
+def _wav_pcm16_layout(path):
+    """Return (data_offset, frames) of a 16 kHz mono 16-bit PCM WAV file, or None for anything else."""
+    try:
+        with open(path, "rb") as f:
+            riff = f.read(12)
+            if len(riff) < 12 or riff[:4] != b"RIFF" or riff[8:12] != b"WAVE":
+                return None
+            
+            pcm16_mono = False
+            while True:
+                header = f.read(8)
+                if len(header) < 8:
+                    return None
+                chunk_id, size = header[:4], struct.unpack("<I", header[4:])[0]
+                if chunk_id == b"fmt ":
+                    fmt = f.read(size)
+                    audio_format, channels, sample_rate = struct.unpack("<HHI", fmt[:8])
+                    bits = struct.unpack("<H", fmt[14:16])[0]
+                    pcm16_mono = audio_format == 1 and channels == 1 and sample_rate == 16000 and bits == 16
+                    f.seek(size % 2, os.SEEK_CUR)
+                elif chunk_id == b"data":
+                    if not pcm16_mono:
+                        return None
+                    offset = f.tell()
+                    # Streamed WAVs may carry a placeholder size; trust the file length instead
+                    size = min(size, os.path.getsize(path) - offset)
+                    return offset, size // 2
+                else:
+                    f.seek(size + size % 2, os.SEEK_CUR)
+    except (OSError, struct.error):
+        return None
+
+def _stream_to_wav(audio_path, output_path):
+    """Decode an audio file into a 16 kHz mono 16-bit WAV file, block by block."""
+    if shutil.which("ffmpeg"):
+        process = subprocess.Popen(
+            ["ffmpeg", "-v", "error", "-nostdin", "-i", audio_path, "-ac", "1", "-ar", "16000", "-f", "s16le", "pipe:1"],
+            stdout=subprocess.PIPE, stderr=subprocess.PIPE
+        )
+        with wave.open(output_path, "wb") as wav:
+            wav.setnchannels(1)
+            wav.setsampwidth(2)
+            wav.setframerate(16000)
+            # Only one block of PCM is ever held in memory
+            for block in iter(lambda: process.stdout.read(1024 * 1024), b""):
+                wav.writeframesraw(block)
+        error = process.stderr.read().decode("utf-8", errors="replace").strip()
+        if process.wait() != 0:
+            raise RuntimeError(f"FFmpeg failed to decode {os.path.basename(audio_path)}: {error}")
+        return
+    
+    if LIBROSA_AVAILABLE:
+        samples, _ = librosa.load(audio_path, sr=16000, mono=True)
+        with wave.open(output_path, "wb") as wav:
+            wav.setnchannels(1)
+            wav.setsampwidth(2)
+            wav.setframerate(16000)
+            wav.writeframes((np.clip(samples, -1.0, 1.0) * 32767).astype("<i2").tobytes())
+        return
+    raise ValueError("FFmpeg or librosa is required to decode audio.")
+
+def _evict_audio_cache(cache_dir, max_bytes, keep=None):
+    """Delete least recently used converted files until the cache fits in its byte budget."""
+    entries = []
+    for filename in os.listdir(cache_dir):
+        if filename.endswith(".wav"):
+            entry_path = os.path.join(cache_dir, filename)
+            stat = os.stat(entry_path)
+            entries.append((stat.st_mtime, stat.st_size, entry_path))
+    
+    total_size = sum(size for _, size, _ in entries)
+    for _, size, entry_path in sorted(entries):
+        if total_size <= max_bytes:
+            break
+        if entry_path == keep:
+            continue
+        try:
+            os.unlink(entry_path)
+            total_size -= size
+        except OSError:
+            pass  # Still mapped by another job on Windows
+
+def convert_to_wav(audio_path, cache_dir=None, max_bytes=DECODED_AUDIO_CACHE_MAX_MB * 1024 * 1024):
+    """
+    Return a 16 kHz mono 16-bit WAV version of an audio file.
+    
+    Files already in that format are returned as they are. Anything else is piped
+    through ffmpeg into a WAV in the decoded-audio cache, keyed by content hash, so
+    each recording is converted once no matter how often it is processed.
+    """
+    if _wav_pcm16_layout(audio_path) is not None:
+        return audio_path
+    
+    if cache_dir is None:
+        # Use APP_BASE_DIR if available
+        if APP_BASE_DIR:
+            cache_dir = os.path.join(APP_BASE_DIR, "audio_cache")
+        else:
+            cache_dir = "audio_cache"
+    wav_path = os.path.join(cache_dir, f"{file_content_hash(audio_path)}.wav")
+    
+    with _audio_cache_lock:
+        if os.path.exists(wav_path):
+            # Touch the entry so eviction treats it as recently used
+            os.utime(wav_path, None)
+            return wav_path
+        
+        os.makedirs(cache_dir, exist_ok=True)
+        temp_path = f"{wav_path}.{uuid.uuid4().hex}.tmp"
+        try:
+            _stream_to_wav(audio_path, temp_path)
+            os.replace(temp_path, wav_path)
+        finally:
+            if os.path.exists(temp_path):
+                os.unlink(temp_path)
+        _evict_audio_cache(cache_dir, max_bytes, keep=wav_path)
+    return wav_path
+
+class DecodedAudio:
+    """
+    An audio file decoded once to 16 kHz mono samples.
+    
+    The samples come from convert_to_wav and are memory-mapped straight out of the
+    WAV file. Duration queries, diarization windows and worker processes all read
+    those pages instead of decoding the file again, and later runs on the same
+    audio skip decoding.
+    """
+    sample_rate = 16000
+    
+    def __init__(self, source_path, wav_path):
+        self.source_path = source_path
+        self.wav_path = wav_path
+        offset, frames = _wav_pcm16_layout(wav_path)
+        if frames > 0:
+            self.samples = np.memmap(wav_path, dtype="<i2", mode="r", offset=offset, shape=(frames,))
+        else:
+            self.samples = np.zeros(0, dtype="<i2")
+    
+    def __reduce__(self):
+        # Worker processes map the WAV themselves instead of receiving a copy of the samples
+        return (DecodedAudio, (self.source_path, self.wav_path))
+    
+    @classmethod
+    def load(cls, audio_path, cache_dir=None):
+        """Return the decoded audio of a file, converting it only if it isn't cached yet."""
+        return cls(audio_path, convert_to_wav(audio_path, cache_dir))
+    
+    @property
+    def duration(self):
+        """Length of the audio in seconds."""
+        return len(self.samples) / self.sample_rate
+    
+    def speech_regions(self, start=0.0, end=None):
+        """
+        Find the stretches of speech between two times with a vectorized energy detector.
+        
+        Frames are speech when their RMS is well above the quiet floor of the audio;
+        speech is padded by DIARIZATION_VAD_PADDING and only silences longer than
+        DIARIZATION_VAD_MIN_SILENCE separate two regions.
+        
+        Returns:
+            List of (start, end) times in seconds, in order
+        """
+        end = self.duration if end is None else min(end, self.duration)
+        frame = int(self.sample_rate * DIARIZATION_VAD_FRAME_SECONDS)
+        first_sample = max(0, int(round(start * self.sample_rate)))
+        frames = max(0, int(round(end * self.sample_rate)) - first_sample) // frame
+        if frames == 0:
+            return [(start, end)] if end > start else []
+        
+        # Frame energies in blocks, so long audio is never converted to float in one piece
+        rms = np.empty(frames, dtype=np.float32)
+        block = 8192
+        for i in range(0, frames, block):
+            count = min(block, frames - i)
+            offset = first_sample + i * frame
+            samples = self.samples[offset:offset + count * frame].astype(np.float32).reshape(count, frame)
+            rms[i:i + count] = np.sqrt(np.mean(samples * samples, axis=1))
+        
+        # Same adaptive floor as the live pause detector: above the quiet frames, below typical speech
+        threshold = max(DIARIZATION_VAD_SILENCE_RMS, min(2.0 * float(np.percentile(rms, 10)), 0.25 * float(np.median(rms))))
+        speech = rms >= threshold
+        
+        # Pad speech on both sides (a dilation by running sum)
+        pad = int(round(DIARIZATION_VAD_PADDING / DIARIZATION_VAD_FRAME_SECONDS))
+        running = np.concatenate(([0], np.cumsum(speech)))
+        index = np.arange(frames)
+        speech = running[np.minimum(frames, index + pad + 1)] - running[np.maximum(0, index - pad)] > 0
+        
+        edges = np.flatnonzero(np.diff(np.concatenate(([False], speech, [False])).astype(np.int8)))
+        region_starts, region_ends = edges[0::2], edges[1::2]
+        if len(region_starts) == 0:
+            return []
+        
+        # Bridge silences too short to be worth cutting out
+        gaps = region_starts[1:] - region_ends[:-1]
+        cuts = np.flatnonzero(gaps * DIARIZATION_VAD_FRAME_SECONDS >= DIARIZATION_VAD_MIN_SILENCE)
+        region_starts = np.concatenate(([region_starts[0]], region_starts[cuts + 1]))
+        region_ends = np.concatenate((region_ends[cuts], [region_ends[-1]]))
+        
+        frame_seconds = frame / self.sample_rate
+        return [
+            (start + region_start * frame_seconds, min(end, start + region_end * frame_seconds))
+            for region_start, region_end in zip(region_starts.tolist(), region_ends.tolist())
+        ]
+    
+    def speech_input(self, start=0.0, end=None):
+        """
+        Return pipeline input holding only the speech between two times, and how to map its times back.
+        
+        Returns:
+            (input, remap) tuple; remap is a TimestampRemap from input time to original-audio time
+        """
+        end = self.duration if end is None else min(end, self.duration)
+        regions = self.speech_regions(start, end)
+        if not regions or sum(b - a for a, b in regions) > (1.0 - DIARIZATION_VAD_MIN_SKIPPED) * (end - start):
+            # Too little silence to be worth the cuts
+            regions = [(start, end)]
+        
+        waveform = np.concatenate([self.crop(a, b) for a, b in regions])
+        pipeline_input = {"waveform": torch.from_numpy(waveform).unsqueeze(0), "sample_rate": self.sample_rate}
+        return pipeline_input, TimestampRemap.from_spans(regions)
+    
+    def fingerprint(self, end):
+        """Return a hash of the samples before a time, to tell whether a recording has only grown since."""
+        digest = hashlib.sha256()
+        last = min(len(self.samples), max(0, int(round(end * self.sample_rate))))
+        for first in range(0, last, 1024 * 1024):
+            digest.update(self.samples[first:min(last, first + 1024 * 1024)].tobytes())
+        return digest.hexdigest()
+    
+    def crop(self, start=0.0, end=None):
+        """Return the samples between two times in seconds as float32 in [-1, 1]."""
+        first = max(0, int(round(start * self.sample_rate)))
+        last = len(self.samples) if end is None else min(len(self.samples), int(round(end * self.sample_rate)))
+        return self.samples[first:max(first, last)].astype(np.float32) / 32768.0
+    
+    def waveform(self, start=0.0, end=None):
+        """Return the samples between two times as a (1, samples) torch tensor."""
+        return torch.from_numpy(self.crop(start, end)).unsqueeze(0)
+
+class TimestampRemap:
+    """Maps times in audio with cut-out spans back to times in the original recording."""
+    def __init__(self, spans):
+        # Each span is (upload_start, original_start, length), sorted by upload_start
+        self.spans = spans
+        self._upload_starts = [span[0] for span in spans]
+    
+    @classmethod
+    def from_spans(cls, keep_spans, start=0.0):
+        """Build a remap from the (start, end) original-time spans that were kept, in order."""
+        if not keep_spans:
+            return cls([(0.0, start, float("inf"))])
+        
+        spans = []
+        position = 0.0
+        for span_start, span_end in keep_spans:
+            spans.append((position, span_start, span_end - span_start))
+            position += span_end - span_start
+        return cls(spans)
+    
+    def to_original(self, t, is_end=False):
+        """
+        Convert a time in the trimmed audio to original-audio time.
+        
+        A time exactly on a cut belongs to the span before it when it ends something
+        (is_end=True) and to the span after it when it starts something.
+        """
+        import bisect
+        
+        if is_end:
+            index = bisect.bisect_left(self._upload_starts, t) - 1
+        else:
+            index = bisect.bisect_right(self._upload_starts, t) - 1
+        index = max(index, 0)
+        
+        upload_start, original_start, length = self.spans[index]
+        offset = t - upload_start
+        if index < len(self.spans) - 1:
+            offset = min(offset, length)
+        return original_start + offset
+    
+    def to_original_spans(self, start, end):
+        """Convert a stretch of trimmed-audio time into the original-time pieces it covers, split at cuts."""
+        import bisect
+        
+        pieces = []
+        first = max(0, bisect.bisect_right(self._upload_starts, start) - 1)
+        for upload_start, original_start, length in self.spans[first:]:
+            if upload_start >= end:
+                break
+            piece_start, piece_end = max(start, upload_start), min(end, upload_start + length)
+            if piece_end > piece_start:
+                pieces.append((original_start + piece_start - upload_start, original_start + piece_end - upload_start))
+        return pieces
+
+class WordTimeline:
+    """
+    Word-level timestamps of a transcript, kept in flat arrays.
+    
+    Whisper's word objects carry no punctuation, so each word also records where
+    its stretch of the transcript text ends; joining word stretches gives back
+    the punctuated text, split wherever the speaker changes.
+    """
+    def __init__(self, text, words, starts, ends, text_ends):
+        self.text = text
+        self.words = words  # List of word strings
+        self.starts = starts  # array('d') of start times in seconds
+        self.ends = ends  # array('d') of end times in seconds
+        self.text_ends = text_ends  # array('l') of offsets in text where each word's stretch ends
+    
+    @classmethod
+    def from_response(cls, response):
+        """Build a timeline from a verbose_json transcription, or return None if it has no word timestamps."""
+        from array import array
+        
+        text = getattr(response, "text", None) or ""
+        words = getattr(response, "words", None)
+        if not words:
+            return None
+        
+        lowered = text.lower()
+        cursor = 0
+        texts, starts, ends, text_ends = [], array("d"), array("d"), array("l")
+        for word in words:
+            token = word.word.strip()
+            texts.append(token)
+            starts.append(word.start)
+            ends.append(word.end)
+            
+            # Find the word in the text, not too far ahead, then take its trailing punctuation with it
+            index = lowered.find(token.lower(), cursor, cursor + len(token) + 200) if token else -1
+            if index != -1:
+                cursor = index + len(token)
+                while cursor < len(text) and not text[cursor].isspace() and not text[cursor].isalnum():
+                    cursor += 1
+            text_ends.append(cursor)
+        
+        if text_ends:
+            text_ends[-1] = len(text)
+        return cls(text, texts, starts, ends, text_ends)
+    
+    def __len__(self):
+        return len(self.words)
+    
+    def assign_speakers(self, turns, max_gap=1.0):
+        """
+        Label each word with the speaker talking at its midpoint.
+        
+        Args:
+            turns: List of (start, end, speaker) tuples
+            max_gap: Words outside every turn take the nearest turn within this many seconds
+        
+        Returns:
+            List with one speaker label (or None) per word
+        """
+        import bisect
+        
+        turns = sorted(turns)
+        turn_starts = [turn[0] for turn in turns]
+        labels = []
+        for start, end in zip(self.starts, self.ends):
+            midpoint = (start + end) / 2
+            index = bisect.bisect_right(turn_starts, midpoint) - 1
+            
+            best, best_gap = None, max_gap
+            # Check the turn starting at or before the midpoint, plus a few earlier ones that may overlap it
+            for candidate in range(index, max(index - 4, -1), -1):
+                gap = max(0.0, midpoint - turns[candidate][1])
+                if gap < best_gap:
+                    best, best_gap = turns[candidate][2], gap
+            if index + 1 < len(turns) and turns[index + 1][0] - midpoint < best_gap:
+                best = turns[index + 1][2]
+            labels.append(best)
+        return labels
+    
+    def group_by_speaker(self, labels):
+        """
+        Split the punctuated text into consecutive runs of words with the same speaker.
+        
+        Words without a label stay with the speaker before them.
+        
+        Returns:
+            List of (speaker, text) tuples
+        """
+        groups = []
+        current = None
+        group_start = 0
+        for i, label in enumerate(labels):
+            if label is None:
+                label = current if current is not None else next((l for l in labels if l is not None), None)
+            if label != current and i > 0:
+                text = self.text[group_start:self.text_ends[i - 1]].strip()
+                if text:
+                    groups.append((current, text))
+                group_start = self.text_ends[i - 1]
+            current = label
+        
+        text = self.text[group_start:].strip()
+        if text:
+            groups.append((current, text))
+        return groups
+
+class TranscriptionBackend:
+    """Interface of the engines that turn prepared audio uploads into verbose_json transcriptions."""
+    name = None
+    label = None
+    model = None  # Identifies the engine and model in transcription cache keys
+    decodes_locally = False  # Takes 16 kHz float32 samples instead of compressed uploads
+    
+    def transcribe(self, upload, language=None):
+        """Transcribe one upload and return a TranscriptionVerbose with word and segment timestamps."""
+        return self.transcribe_many([upload], language)[0]
+    
+    def transcribe_many(self, uploads, language=None, progress_callback=None):
+        """
+        Transcribe several uploads of the same recording.
+        
+        Args:
+            uploads: List of (filename, bytes[, content_type]) tuples, or of 16 kHz mono
+                float32 sample arrays for backends that decode locally
+            language: Optional language code
+            progress_callback: Optional function called with (completed, total)
+        
+        Returns:
+            List of TranscriptionVerbose responses in the order of uploads
+        """
+        raise NotImplementedError
+
+class OpenAIWhisperBackend(TranscriptionBackend):
+    """Transcribes with the OpenAI Whisper API, sending chunks in parallel."""
+    name = "openai"
+    label = "OpenAI Whisper API"
+    
+    def __init__(self, client, model=WHISPER_MODEL, max_parallel=WHISPER_MAX_PARALLEL_UPLOADS):
+        self.client = client
+        self.model = model
+        self.max_parallel = max_parallel
+    
+    def transcribe(self, upload, language=None):
+        """Send one upload to Whisper through the shared request scheduler."""
+        return openai_scheduler.call(
+            self.client.audio.transcriptions.create,
+            file=upload,
+            model=self.model,
+            language=language,
+            response_format="verbose_json",
+            timestamp_granularities=["word", "segment"]
+        )
+    
+    def transcribe_many(self, uploads, language=None, progress_callback=None):
+        """Send uploads in parallel and return the responses in order."""
+        import concurrent.futures
+        
+        results = [None] * len(uploads)
+        completed = 0
+        max_workers = max(1, min(self.max_parallel, len(uploads)))
+        
+        with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = {executor.submit(self.transcribe, upload, language): i for i, upload in enumerate(uploads)}
+            for future in concurrent.futures.as_completed(futures):
+                try:
+                    results[futures[future]] = future.result()
+                except Exception:
+                    # Don't keep uploading the remaining chunks if one of them failed
+                    for pending in futures:
+                        pending.cancel()
+                    raise
+                
+                completed += 1
+                if progress_callback:
+                    progress_callback(completed, len(uploads))
+        
+        return results
+
+class LocalWhisperBackend(TranscriptionBackend):
+    """
+    Runs a Whisper model locally on the CPU with transformers and torch.
+    
+    Audio never leaves the machine. The pipeline cuts every upload into 30-second
+    windows and runs them through the model in batches, so windows from all
+    chunks of a recording share the same forward passes.
+    """
+    name = "local"
+    label = "Local Whisper (CPU)"
+    decodes_locally = True
+    
+    def __init__(self, model_name=LOCAL_WHISPER_MODEL, batch_size=LOCAL_WHISPER_BATCH_SIZE, num_threads=None):
+        self.model_name = model_name
+        self.model = f"local/{model_name}"
+        self.batch_size = batch_size
+        self.num_threads = num_threads or os.cpu_count() or 4
+        self._pipeline = None
+        self._lock = threading.Lock()  # One inference at a time; it already uses every core
+    
+    def transcribe_many(self, uploads, language=None, progress_callback=None):
+        """Decode the uploads and transcribe them in shared batches on the CPU."""
+        if not TRANSFORMERS_AVAILABLE:
+            raise RuntimeError("Local transcription requires transformers and torch. Install with: pip install transformers torch")
+        
+        audio = [self._decode(upload) for upload in uploads]
+        generate_kwargs = {"task": "transcribe"}
+        if language:
+            generate_kwargs["language"] = language
+        
+        results = []
+        with self._lock:
+            outputs = self._get_pipeline()(
+                ({"raw": samples, "sampling_rate": 16000} for samples in audio),
+                batch_size=self.batch_size,
+                return_timestamps="word",
+                generate_kwargs=generate_kwargs
+            )
+            for samples, output in zip(audio, outputs):
+                results.append(self._to_verbose(output, len(samples) / 16000.0, language))
+                if progress_callback:
+                    progress_callback(len(results), len(uploads))
+        return results
+    
+    def _get_pipeline(self):
+        """Load the model on first use."""
+        if self._pipeline is None:
+            import torch
+            torch.set_num_threads(self.num_threads)
+            self._pipeline = transformers.pipeline(
+                "automatic-speech-recognition",
+                model=self.model_name,
+                device="cpu",
+                torch_dtype=torch.float32,
+                chunk_length_s=30
+            )
+        return self._pipeline
+    
+    def _decode(self, upload):
+        """Decode an upload to 16 kHz mono float32 samples."""
+        if isinstance(upload, np.ndarray):
+            # Already decoded from the original audio
+            return upload
+        data = upload[1]
+        if shutil.which("ffmpeg"):
+            result = subprocess.run(
+                ["ffmpeg", "-v", "error", "-nostdin", "-i", "pipe:0", "-ac", "1", "-ar", "16000", "-f", "f32le", "pipe:1"],
+                input=data, stdout=subprocess.PIPE, stderr=subprocess.PIPE, check=True
+            )
+            return np.frombuffer(result.stdout, dtype=np.float32)
+        if LIBROSA_AVAILABLE:
+            samples, _ = librosa.load(BytesIO(data), sr=16000, mono=True)
+            return samples.astype(np.float32)
+        raise ValueError("FFmpeg or librosa is required to decode audio for local transcription.")
+    
+    def _to_verbose(self, output, duration, language=None):
+        """Convert pipeline output with word chunks into a TranscriptionVerbose."""
+        from openai.types.audio import TranscriptionVerbose
+        
+        words = []
+        for chunk in output.get("chunks") or []:
+            start, end = chunk.get("timestamp") or (None, None)
+            start = float(start) if start is not None else (words[-1]["end"] if words else 0.0)
+            end = float(end) if end is not None else duration
+            words.append({"word": chunk["text"].strip(), "start": start, "end": max(start, end)})
+        
+        # Group words into segments at sentence ends and pauses, like Whisper's own segments
+        segments = []
+        current = []
+        for i, word in enumerate(words):
+            current.append(word)
+            next_word = words[i + 1] if i + 1 < len(words) else None
+            sentence_end = word["word"].endswith((".", "?", "!"))
+            pause = next_word is not None and next_word["start"] - word["end"] > 1.0
+            too_long = word["end"] - current[0]["start"] > 30.0
+            if next_word is None or sentence_end or pause or too_long:
+                segments.append({
+                    "id": len(segments),
+                    "seek": int(current[0]["start"] * 100),
+                    "start": current[0]["start"],
+                    "end": current[-1]["end"],
+                    "text": " " + " ".join(w["word"] for w in current),
+                    "tokens": [],
+                    "temperature": 0.0,
+                    "avg_logprob": 0.0,
+                    "compression_ratio": 0.0,
+                    "no_speech_prob": 0.0
+                })
+                current = []
+        
+        return TranscriptionVerbose.model_validate({
+            "text": (output.get("text") or "").strip(),
+            "language": language or "",
+            "duration": duration,
+            "words": words,
+            "segments": segments
+        })
+
+class DiarizationPipelinePool:
+    """
+    Process-wide registry of loaded pyannote pipelines.
+    
+    Each model is loaded once per device and lent to one job at a time. A job may
+    instantiate its own hyperparameters; the model's defaults are restored when
+    it hands the pipeline back, so no weights are ever reloaded. Pipelines that
+    nobody has used for idle_seconds are unloaded to free their memory.
+    
+    In CPU mode, CPU pipelines get dynamically int8-quantized segmentation and
+    embedding models, run under torch.inference_mode and use batch sizes that suit CPU caches.
+    With ONNX enabled, CPU pipelines run the models exported by export_diarization_onnx
+    through ONNX Runtime instead.
+    """
+    def __init__(self, idle_seconds=DIARIZATION_PIPELINE_IDLE_SECONDS):
+        self.idle_seconds = idle_seconds
+        self.cpu_mode = True
+        self.onnx = False
+        self.intra_op_threads = DIARIZATION_CPU_INTRA_OP_THREADS
+        self.inter_op_threads = DIARIZATION_CPU_INTER_OP_THREADS
+        self._entries = {}  # (model, device, cpu_mode, onnx) -> {"lock", "pipeline", "defaults", "last_used"}
+        self._lock = threading.Lock()
+        self._reaper = None
+    
+    def configure(self, idle_seconds):
+        """Set how long an unused pipeline stays loaded."""
+        self.idle_seconds = max(1, int(idle_seconds))
+    
+    def configure_cpu(self, enabled=True, intra_op_threads=DIARIZATION_CPU_INTRA_OP_THREADS,
+                      inter_op_threads=DIARIZATION_CPU_INTER_OP_THREADS):
+        """
+        Turn the CPU performance mode on or off and set torch's thread counts for it.
+        
+        Args:
+            enabled: Whether CPU pipelines are quantized, run in inference mode and use CPU batch sizes
+            intra_op_threads: Threads inside one operation; 0 uses every core
+            inter_op_threads: Threads running independent operations side by side; 0 keeps torch's default
+        """
+        self.cpu_mode = bool(enabled)
+        self.intra_op_threads = int(intra_op_threads)
+        self.inter_op_threads = int(inter_op_threads)
+        if not self.cpu_mode or not DIARIZATION_AVAILABLE:
+            return
+        
+        torch.set_num_threads(max(1, int(intra_op_threads) or os.cpu_count() or 1))
+        if int(inter_op_threads) > 0:
+            try:
+                torch.set_num_interop_threads(int(inter_op_threads))
+            except RuntimeError:
+                pass  # Torch only allows this before its first parallel work
+    
+    def configure_onnx(self, enabled):
+        """Run CPU pipelines' models through ONNX Runtime (when exported) or through torch."""
+        self.onnx = bool(enabled) and ONNXRUNTIME_AVAILABLE
+    
+    def inference_mode(self, device=None, onnx=None):
+        """
+        Describe how acquire(device=device, onnx=onnx) would run the models.
+        
+        Quantized, float and ONNX models give slightly different results, so cached
+        diarization results are keyed on this.
+        """
+        device, cpu_mode, onnx = self._resolve(device, onnx)
+        return {"device": device, "cpu_mode": cpu_mode, "onnx": onnx}
+    
+    def _resolve(self, device, onnx):
+        """Return the (device, cpu_mode, onnx) a job asking for device and onnx runs with."""
+        device = device or ("cuda" if torch.cuda.is_available() else "cpu")
+        cpu_mode = self.cpu_mode and device == "cpu"
+        onnx = (self.onnx if onnx is None else bool(onnx) and ONNXRUNTIME_AVAILABLE) and device == "cpu"
+        return device, cpu_mode, onnx
+    
+    @contextlib.contextmanager
+    def acquire(self, model, token=None, device=None, params=None, attributes=None, onnx=None):
+        """
+        Borrow the pipeline for a model, loading it on first use.
+        
+        Args:
+            model: Hugging Face pipeline name, e.g. "pyannote/speaker-diarization-3.1"
+            token: Hugging Face token used if the model has to be loaded
+            device: "cpu" or "cuda"; defaults to CUDA when available
+            params: Optional hyperparameters to instantiate for this job only
+            attributes: Optional pipeline attributes (e.g. embedding_batch_size) for this job only;
+                in CPU mode the CPU batch sizes replace the job's
+            onnx: Whether to use the ONNX Runtime models on a CPU; defaults to the pool's setting
+        """
+        device, cpu_mode, onnx = self._resolve(device, onnx)
+        with self._lock:
+            entry = self._entries.setdefault((model, device, cpu_mode, onnx), {
+                "lock": threading.Lock(), "pipeline": None, "defaults": None, "last_used": 0.0
+            })
+        
+        if cpu_mode:
+            # Large batches only pay off on a GPU; on a CPU they spill out of the caches
+            attributes = dict(
+                attributes or {},
+                segmentation_batch_size=DIARIZATION_CPU_SEGMENTATION_BATCH_SIZE,
+                embedding_batch_size=DIARIZATION_CPU_EMBEDDING_BATCH_SIZE
+            )
+        
+        with entry["lock"]:
+            if entry["pipeline"] is None:
+                entry["pipeline"], entry["defaults"] = self._load(model, token, device, quantize=cpu_mode, onnx=onnx)
+            pipeline = entry["pipeline"]
+            
+            saved = {name: getattr(pipeline, name) for name in (attributes or {})}
+            try:
+                for name, value in (attributes or {}).items():
+                    setattr(pipeline, name, value)
+                if params:
+                    pipeline.instantiate(params)
+                with torch.inference_mode() if cpu_mode else contextlib.nullcontext():
+                    yield pipeline
+            finally:
+                try:
+                    for name, value in saved.items():
+                        setattr(pipeline, name, value)
+                    if entry["defaults"]:
+                        pipeline.instantiate(entry["defaults"])
+                except Exception as e:
+                    # A pipeline in an unknown state is reloaded by the next job
+                    print(f"Error restoring diarization pipeline defaults: {e}")
+                    entry["pipeline"] = None
+                entry["last_used"] = time.monotonic()
+        
+        self._start_reaper()
+    
+    def unload_idle(self, max_idle=None):
+        """Unload pipelines that are not in use and have been idle for max_idle seconds."""
+        max_idle = self.idle_seconds if max_idle is None else max_idle
+        now = time.monotonic()
+        unloaded = 0
+        
+        with self._lock:
+            entries = list(self._entries.values())
+        for entry in entries:
+            if entry["pipeline"] is None or now - entry["last_used"] < max_idle:
+                continue
+            # Skip pipelines a job is holding
+            if entry["lock"].acquire(blocking=False):
+                try:
+                    entry["pipeline"] = None
+                    entry["defaults"] = None
+                    unloaded += 1
+                finally:
+                    entry["lock"].release()
+        
+        if unloaded:
+            import gc
+            gc.collect()
+            if torch.cuda.is_available():
+                torch.cuda.empty_cache()
+        return unloaded
+    
+    def _load(self, model, token, device, quantize=False, onnx=False):
+        """Load a pipeline onto a device and remember its default hyperparameters."""
+        pipeline = pyannote.audio.Pipeline.from_pretrained(model, use_auth_token=token)
+        if pipeline is None:
+            raise ValueError(f"Could not load {model}. Check your PyAnnote token and that you accepted the model's terms.")
+        pipeline.to(torch.device(device))
+        
+        onnx_parts = []
+        if onnx:
+            model_dir = _onnx_model_dir(model)
+            try:
+                onnx_parts = _use_onnx_models(pipeline, model_dir, self.intra_op_threads, self.inter_op_threads)
+            except Exception as e:
+                # The torch models are still in place
+                print(f"WARNING: Error loading ONNX diarization models from {model_dir}: {e}")
+            if not onnx_parts:
+                print(f"WARNING: No ONNX diarization models loaded from {model_dir}; {model} runs on torch")
+            elif "embedding" not in onnx_parts:
+                print(f"WARNING: No ONNX speaker embedding model in {model_dir}; embeddings run on torch")
+        # The ONNX models are float exports; quantizing the torch ones would make them disagree
+        if quantize and "segmentation" not in onnx_parts:
+            _quantize_segmentation_model(pipeline)
+        if quantize and "embedding" not in onnx_parts:
+            _quantize_speaker_embedding(getattr(pipeline, "_embedding", None))
+        
+        try:
+            defaults = pipeline.parameters(instantiated=True)
+        except Exception:
+            defaults = None
+        return pipeline, defaults
+    
+    def _start_reaper(self):
+        """Start the background thread that unloads idle pipelines, if it isn't running."""
+        with self._lock:
+            if self._reaper is not None and self._reaper.is_alive():
+                return
+            self._reaper = threading.Thread(target=self._reap, daemon=True)
+            self._reaper.start()
+    
+    def _reap(self):
+        """Unload idle pipelines until none are left loaded."""
+        while True:
+            time.sleep(max(1.0, min(60.0, self.idle_seconds / 2)))
+            self.unload_idle()
+            with self._lock:
+                if not any(entry["pipeline"] is not None for entry in self._entries.values()):
+                    self._reaper = None
+                    return
+
+def _quantize_segmentation_model(pipeline):
+    """
+    Swap the segmentation model's LSTM and linear layers for dynamic int8 versions, in place.
+    
+    The stacked bidirectional LSTM of PyanNet is where segmentation spends its time,
+    unlike the convolutional speaker embeddings, where only the final projection is affected.
+    """
+    inference = getattr(pipeline, "_segmentation", None)
+    model = getattr(inference, "model", None)
+    if not isinstance(model, torch.nn.Module):
+        return
+    try:
+        # In place, so the model keeps its specifications and receptive field
+        torch.ao.quantization.quantize_dynamic(model, {torch.nn.LSTM, torch.nn.Linear}, dtype=torch.qint8, inplace=True)
+    except Exception as e:
+        # The float model still works, just slower
+        print(f"Error quantizing segmentation model: {e}")
+
+def _quantize_speaker_embedding(embedding):
+    """Swap the linear and recurrent layers of a pretrained speaker embedding for dynamic int8 versions."""
+    # pyannote models keep the network in model_, SpeechBrain ones in classifier_
+    for attribute in ("model_", "classifier_"):
+        module = getattr(embedding, attribute, None)
+        if isinstance(module, torch.nn.Module):
+            try:
+                setattr(embedding, attribute, torch.ao.quantization.quantize_dynamic(
+                    module, {torch.nn.Linear, torch.nn.LSTM}, dtype=torch.qint8
+                ))
+            except Exception as e:
+                # The float model still works, just slower
+                print(f"Error quantizing speaker embedding model: {e}")
+            return
+
+def _onnx_model_dir(model):
+    """Return the directory holding the ONNX exports of a pipeline model."""
+    base_dir = os.path.join(APP_BASE_DIR, "onnx_models") if APP_BASE_DIR else "onnx_models"
+    return os.path.join(base_dir, re.sub(r"[^\w.@-]+", "_", model))
+
+def _onnx_session(path, intra_op_threads=0, inter_op_threads=0):
+    """Open a CPU ONNX Runtime session with all graph optimizations and the given thread counts (0 = default)."""
+    options = onnxruntime.SessionOptions()
+    options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+    options.intra_op_num_threads = max(0, int(intra_op_threads))
+    options.inter_op_num_threads = max(0, int(inter_op_threads))
+    if int(inter_op_threads) > 1:
+        options.execution_mode = onnxruntime.ExecutionMode.ORT_PARALLEL
+    return onnxruntime.InferenceSession(path, sess_options=options, providers=["CPUExecutionProvider"])
+
+def export_diarization_onnx(model, token=None, output_dir=None):
+    """
+    Export a pipeline's segmentation and speaker-embedding networks to ONNX.
+    
+    Each export is run next to its torch model on the same input and only kept if the
+    outputs agree within DIARIZATION_ONNX_TOLERANCE. An export.json manifest records
+    what was exported, so a successful export is only attempted once per model.
+    
+    Returns:
+        Dictionary mapping each exported part ("segmentation", "embedding") to its .onnx file
+    """
+    output_dir = output_dir or _onnx_model_dir(model)
+    os.makedirs(output_dir, exist_ok=True)
+    
+    # A fresh float pipeline; the pool's CPU pipelines may hold quantized layers
+    pipeline = pyannote.audio.Pipeline.from_pretrained(model, use_auth_token=token)
+    if pipeline is None:
+        raise ValueError(f"Could not load {model}. Check your PyAnnote token and that you accepted the model's terms.")
+    
+    inference = pipeline._segmentation
+    segmentation_network = inference.model.eval()
+    waveforms = 0.1 * torch.randn(2, 1, int(round(inference.duration * DecodedAudio.sample_rate)))
+    parts = {"segmentation": (segmentation_network, (waveforms,), ["waveforms"], ["segmentations"])}
+    
+    embedding_network = getattr(pipeline._embedding, "model_", None)
+    if isinstance(embedding_network, torch.nn.Module):
+        class EmbeddingNetwork(torch.nn.Module):
+            # Masks are a keyword argument of pyannote embedding networks; ONNX inputs are positional
+            def __init__(self):
+                super().__init__()
+                self.network = embedding_network.eval()
+            
+            def forward(self, waveforms, weights):
+                return self.network(waveforms, weights=weights)
+        
+        with torch.no_grad():
+            num_frames = segmentation_network(waveforms).shape[1]
+        weights = torch.rand(2, num_frames)
+        parts["embedding"] = (EmbeddingNetwork(), (waveforms, weights), ["waveforms", "weights"], ["embeddings"])
+    else:
+        print(f"The speaker embedding of {model} is not a pyannote network; it keeps running on torch")
+    
+    exported = {}
+    for name, (network, inputs, input_names, output_names) in parts.items():
+        path = os.path.join(output_dir, f"{name}.onnx")
+        try:
+            with torch.no_grad():
+                expected = network(*inputs).numpy()
+                torch.onnx.export(
+                    network, inputs, path,
+                    input_names=input_names, output_names=output_names,
+                    dynamic_axes={axis_name: {0: "batch"} for axis_name in input_names + output_names},
+                    opset_version=DIARIZATION_ONNX_OPSET
+                )
+            actual = _onnx_session(path).run(None, {n: t.numpy() for n, t in zip(input_names, inputs)})[0]
+            difference = float(np.max(np.abs(actual - expected)))
+            if difference > DIARIZATION_ONNX_TOLERANCE:
+                raise ValueError(f"ONNX output differs from torch by {difference:.2g}")
+            exported[name] = path
+            print(f"Exported the {name} model to {path} (largest difference from torch: {difference:.2g})")
+        except Exception as e:
+            if os.path.exists(path):
+                os.remove(path)
+            print(f"Error exporting the {name} model to ONNX: {e}")
+    
+    # Without a manifest the next run tries again
+    if exported:
+        with open(os.path.join(output_dir, "export.json"), "w") as f:
+            json.dump({"model": model, "parts": sorted(exported), "torch": torch.__version__}, f)
+    return exported
+
+class _OnnxEmbeddingNetwork:
+    """
+    Stands in for a pyannote speaker-embedding network, running it through ONNX Runtime.
+    
+    The export has a fixed crop length and mask resolution; other shapes (pyannote probing
+    the network's minimum duration, calls without masks) go to the torch network.
+    """
+    def __init__(self, session, network):
+        self.session = session
+        self.network = network
+        inputs = {item.name: item.shape for item in session.get_inputs()}
+        self.num_samples = inputs["waveforms"][-1]
+        self.num_frames = inputs["weights"][-1]
+    
+    def __call__(self, waveforms, weights=None):
+        if weights is None or waveforms.shape[-1] != self.num_samples or weights.shape[-1] != self.num_frames:
+            return self.network(waveforms) if weights is None else self.network(waveforms, weights=weights)
+        embeddings = self.session.run(None, {
+            "waveforms": waveforms.cpu().numpy().astype(np.float32, copy=False),
+            "weights": weights.cpu().numpy().astype(np.float32, copy=False)
+        })[0]
+        return torch.from_numpy(embeddings)
+    
+    def to(self, device):
+        self.network.to(device)
+        return self
+    
+    def eval(self):
+        self.network.eval()
+        return self
+
+def _use_onnx_models(pipeline, model_dir, intra_op_threads=0, inter_op_threads=0):
+    """
+    Route a loaded pipeline's segmentation and embedding inference through its ONNX exports.
+    
+    Parts without an export keep running on torch.
+    
+    Returns:
+        List of the parts now running on ONNX Runtime
+    """
+    parts = []
+    
+    path = os.path.join(model_dir, "segmentation.onnx")
+    if os.path.exists(path):
+        inference = pipeline._segmentation
+        session = _onnx_session(path, intra_op_threads, inter_op_threads)
+        
+        def infer(chunks):
+            outputs = session.run(None, {"waveforms": chunks.cpu().numpy().astype(np.float32, copy=False)})[0]
+            # Same powerset-to-speakers conversion the torch path applies after the network
+            return inference.conversion(torch.from_numpy(outputs)).numpy()
+        
+        inference.infer = infer
+        parts.append("segmentation")
+    
+    path = os.path.join(model_dir, "embedding.onnx")
+    embedding = getattr(pipeline, "_embedding", None)
+    if os.path.exists(path) and isinstance(getattr(embedding, "model_", None), torch.nn.Module):
+        # Probe these on the torch network before it is wrapped
+        _ = embedding.dimension, embedding.min_num_samples
+        embedding.model_ = _OnnxEmbeddingNetwork(_onnx_session(path, intra_op_threads, inter_op_threads), embedding.model_)
+        parts.append("embedding")
+    
+    return parts
+
+# Every diarization job borrows its pipeline from this pool
+diarization_pipelines = DiarizationPipelinePool()
+
+def _available_memory_mb():
+    """Return the memory available for new work in MB, or None if it can't be determined."""
+    # Linux: MemAvailable counts reclaimable page cache, unlike free memory
+    try:
+        with open("/proc/meminfo") as f:
+            for line in f:
+                if line.startswith("MemAvailable:"):
+                    return int(line.split()[1]) / 1024
+    except (OSError, ValueError, IndexError):
+        pass
+    
+    if sys.platform == "win32":
+        try:
+            import ctypes
+            
+            class MEMORYSTATUSEX(ctypes.Structure):
+                _fields_ = [
+                    ("dwLength", ctypes.c_ulong), ("dwMemoryLoad", ctypes.c_ulong),
+                    ("ullTotalPhys", ctypes.c_ulonglong), ("ullAvailPhys", ctypes.c_ulonglong),
+                    ("ullTotalPageFile", ctypes.c_ulonglong), ("ullAvailPageFile", ctypes.c_ulonglong),
+                    ("ullTotalVirtual", ctypes.c_ulonglong), ("ullAvailVirtual", ctypes.c_ulonglong),
+                    ("ullAvailExtendedVirtual", ctypes.c_ulonglong)
+                ]
+            
+            status = MEMORYSTATUSEX()
+            status.dwLength = ctypes.sizeof(MEMORYSTATUSEX)
+            if ctypes.windll.kernel32.GlobalMemoryStatusEx(ctypes.byref(status)):
+                return status.ullAvailPhys / (1024 * 1024)
+        except Exception:
+            pass
+    
+    # macOS and others: assume half of the physical memory is free to use
+    try:
+        return os.sysconf("SC_PHYS_PAGES") * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024) / 2
+    except (AttributeError, ValueError, OSError):
+        return None
+
+class DiarizationChunkPlanner:
+    """
+    Plans chunk length, overlap and worker count for chunked diarization on this machine.
+    
+    Workers are limited by cores and by how many loaded pipelines fit into the
+    memory budget; chunks by the memory left per worker. Within those limits each
+    window should keep a worker busy for about DIARIZATION_TARGET_WINDOW_SECONDS,
+    estimated from the diarization throughput measured on this host. Throughput is
+    measured once with a short calibration run and refined after every job.
+    """
+    def __init__(self, profile_path=None):
+        if profile_path is None:
+            # Use APP_BASE_DIR if available
+            if APP_BASE_DIR:
+                profile_path = os.path.join(APP_BASE_DIR, "diarization_profile.json")
+            else:
+                profile_path = "diarization_profile.json"
+        self.profile_path = profile_path
+        self._lock = threading.Lock()
+    
+    def _profile_key(self, model, onnx=False):
+        """Key measurements by host, model and inference mode; they don't carry over to other setups."""
+        device = "cuda" if DIARIZATION_AVAILABLE and torch.cuda.is_available() else "cpu"
+        mode = "cpu-optimized" if device == "cpu" and diarization_pipelines.cpu_mode else device
+        if onnx and device == "cpu":
+            mode += "-onnx"
+        return f"{platform.node()}|{os.cpu_count()}|{model}|{mode}"
+    
+    def _read_profile(self):
+        """Return the stored measurements, or an empty dict."""
+        try:
+            with open(self.profile_path, "r") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+    
+    def throughput(self, model, onnx=False):
+        """Return the measured seconds of audio diarized per second per torch thread, or None."""
+        with self._lock:
+            return self._read_profile().get(self._profile_key(model, onnx))
+    
+    def record(self, model, audio_seconds, elapsed, threads, onnx=False):
+        """
+        Fold a measured run into the stored throughput for this host.
+        
+        Args:
+            model: Diarization pipeline that ran
+            audio_seconds: Seconds of audio diarized, overlaps included
+            elapsed: Wall-clock seconds the run took
+            threads: Torch threads that worked on it, over all workers
+            onnx: Whether the models ran through ONNX Runtime
+        """
+        if audio_seconds <= 0 or elapsed <= 0 or threads <= 0:
+            return
+        measured = audio_seconds / (elapsed * threads)
+        
+        with self._lock:
+            profile = self._read_profile()
+            key = self._profile_key(model, onnx)
+            previous = profile.get(key)
+            # Moving average, so one unusual run doesn't swing the plans
+            profile[key] = measured if previous is None else 0.7 * previous + 0.3 * measured
+            try:
+                directory = os.path.dirname(os.path.abspath(self.profile_path))
+                os.makedirs(directory, exist_ok=True)
+                with open(self.profile_path, "w") as f:
+                    json.dump(profile, f, indent=2)
+            except OSError as e:
+                print(f"Error saving diarization profile: {e}")
+    
+    def plan(self, duration, model, calibrate=None, onnx=False):
+        """
+        Plan a chunked diarization.
+        
+        Args:
+            duration: Seconds of audio to diarize
+            model: Diarization pipeline that will run
+            calibrate: Optional callable run when this host has no measurement yet;
+                returns (audio_seconds, elapsed, threads) of a short diarization
+            onnx: Whether the models will run through ONNX Runtime
+        
+        Returns:
+            Dictionary with chunk_size and overlap in seconds, workers, and threads per worker
+        """
+        cpu_count = os.cpu_count() or 4
+        threads = max(1, min(DIARIZATION_THREADS_PER_WORKER, cpu_count))
+        
+        available_mb = _available_memory_mb()
+        budget_mb = (available_mb if available_mb is not None else DIARIZATION_FALLBACK_MEMORY_MB) * DIARIZATION_MEMORY_FRACTION
+        
+        # As many workers as the cores allow and the budget holds with a minimum-length window
+        smallest_worker_mb = DIARIZATION_WORKER_MEMORY_MB + DIARIZATION_MEMORY_MB_PER_CHUNK_MINUTE * DIARIZATION_MIN_CHUNK_SECONDS / 60
+        workers = max(1, min(cpu_count // threads, int(budget_mb // smallest_worker_mb), DIARIZATION_MAX_WORKERS))
+        
+        # The longest window the memory left per worker can hold
+        memory_chunk = (budget_mb / workers - DIARIZATION_WORKER_MEMORY_MB) / DIARIZATION_MEMORY_MB_PER_CHUNK_MINUTE * 60
+        max_chunk = min(DIARIZATION_MAX_CHUNK_SECONDS, max(DIARIZATION_MIN_CHUNK_SECONDS, memory_chunk))
+        
+        per_thread = self.throughput(model, onnx)
+        if per_thread is None and calibrate is not None:
+            try:
+                audio_seconds, elapsed, calibration_threads = calibrate()
+                self.record(model, audio_seconds, elapsed, calibration_threads, onnx)
+                per_thread = self.throughput(model, onnx)
+            except Exception as e:
+                print(f"Error calibrating diarization throughput: {e}")
+        
+        # Windows that keep a worker busy for the target time, when the throughput is known
+        chunk_size = max_chunk
+        if per_thread:
+            chunk_size = min(chunk_size, per_thread * threads * DIARIZATION_TARGET_WINDOW_SECONDS)
+        # At least two windows per worker, so no core idles while the last window finishes
+        chunk_size = max(DIARIZATION_MIN_CHUNK_SECONDS, min(chunk_size, duration / (2 * workers)))
+        
+        # Don't start workers that would get no window
+        windows = max(1, math.ceil(duration / chunk_size))
+        workers = min(workers, windows)
+        
+        # Overlap is re-diarized by both neighbours, so keep it a small share of the window
+        overlap = min(DIARIZATION_CHUNK_OVERLAP, max(10.0, 0.1 * chunk_size))
+        return {"chunk_size": chunk_size, "overlap": overlap, "workers": workers, "threads": threads}
+
+# State of a diarization worker process
+_worker_model = None
+_worker_token = None
+
+def _diarization_worker_init(model, token, num_threads, cpu_mode=True, onnx=False, base_dir=None):
+    """Set up a diarization worker process: pin its torch threads and preload the pipeline."""
+    global _worker_model, _worker_token, APP_BASE_DIR
+    _worker_model = model
+    _worker_token = token
+    # Spawned workers don't run the __main__ setup, so the app directory (and the ONNX models in it) comes from the parent
+    if base_dir:
+        APP_BASE_DIR = base_dir
+    diarization_pipelines.cpu_mode = cpu_mode
+    diarization_pipelines.intra_op_threads = num_threads
+    diarization_pipelines.inter_op_threads = 1
+    diarization_pipelines.configure_onnx(onnx)
+    torch.set_num_threads(num_threads)
+    torch.set_num_interop_threads(1)
+    # Load now so the first window doesn't pay for it
+    with diarization_pipelines.acquire(model, token, device="cpu"):
+        pass
+
+def _diarize_window(audio, start, end, pipeline=None, token=None):
+    """
+    Diarize one window of a DecodedAudio.
+    
+    Runs in a worker process unless a pipeline is passed in.
+    
+    Returns:
+        (turns, centroids) tuple: a list of (start, end, speaker) turns in original-audio
+        time with window-local labels, and a dict of speaker centroid embeddings
+    """
+    # Only the speech of the window goes through the models
+    window, remap = audio.speech_input(start, end)
+    waveform, sample_rate = window["waveform"], window["sample_rate"]
+    
+    if pipeline is not None:
+        annotation = pipeline(window)
+    else:
+        token = _worker_token
+        with diarization_pipelines.acquire(_worker_model, token, device="cpu") as worker_pipeline:
+            annotation = worker_pipeline(window)
+    
+    local_turns = [
+        (segment.start, segment.end, speaker)
+        for segment, _, speaker in annotation.itertracks(yield_label=True)
+    ]
+    
+    try:
+        centroids = _speaker_centroids(waveform, sample_rate, local_turns, token)
+    except Exception as e:
+        # Labels can still be matched through the window overlap
+        print(f"Error computing speaker embeddings: {e}")
+        centroids = {}
+    
+    return [
+        (original_start, original_end, speaker)
+        for turn_start, turn_end, speaker in local_turns
+        for original_start, original_end in remap.to_original_spans(turn_start, turn_end)
+    ], centroids
+
+def _annotation_to_original(annotation, remap):
+    """Move an Annotation from speech-only input time to original-audio time, splitting turns at the cuts."""
+    remapped = Annotation(uri=annotation.uri)
+    for segment, _, label in annotation.itertracks(yield_label=True):
+        for start, end in remap.to_original_spans(segment.start, segment.end):
+            piece = Segment(start, end)
+            remapped[piece, remapped.new_track(piece)] = label
+    return remapped
+
+def _run_diarization(pipeline, audio, **kwargs):
+    """
+    Run a diarization pipeline on the speech of DecodedAudio and capture the inference results it clusters.
+    
+    Silent stretches are cut out before the models run; the result is mapped back
+    to original-audio time.
+    
+    Returns:
+        (annotation, features) tuple, where features is a dict of numpy arrays holding the
+        segmentation scores, instantaneous speaker counts and speaker embeddings, or None
+        if the pipeline didn't produce them (e.g. when nobody speaks)
+    """
+    speech, remap = audio.speech_input()
+    captured = {}
+    
+    def hook(step_name, step_artifact, file=None, total=None, completed=None):
+        # Progress calls carry partial artifacts; only keep each step's final result
+        if completed is None and step_artifact is not None:
+            captured[step_name] = step_artifact
+    
+    annotation = _annotation_to_original(pipeline(speech, hook=hook, **kwargs), remap)
+    
+    if not all(step in captured for step in ("segmentation", "speaker_counting", "embeddings")):
+        return annotation, None
+    
+    segmentations = captured["segmentation"]
+    count = captured["speaker_counting"]
+    features = {
+        "segmentations": segmentations.data.astype(np.float16),
+        "segmentations_window": np.array([segmentations.sliding_window.start, segmentations.sliding_window.duration, segmentations.sliding_window.step]),
+        "count": count.data.astype(np.int8),
+        "count_window": np.array([count.sliding_window.start, count.sliding_window.duration, count.sliding_window.step]),
+        "embeddings": np.asarray(captured["embeddings"], dtype=np.float32),
+        "speech_spans": np.array(remap.spans, dtype=np.float64)
+    }
+    return annotation, features
+
+def _recluster_diarization(pipeline, features, num_speakers=None, min_speakers=None, max_speakers=None):
+    """
+    Re-run only the clustering step of a diarization pipeline on features captured by _run_diarization.
+    
+    Clustering hyperparameters (e.g. the clustering threshold) are taken from the pipeline, so
+    borrow it with the wanted params. No segmentation or embedding inference is done.
+    """
+    num_speakers, min_speakers, max_speakers = pipeline.set_num_speakers(
+        num_speakers=num_speakers, min_speakers=min_speakers, max_speakers=max_speakers
+    )
+    
+    start, duration, step = features["segmentations_window"].tolist()
+    segmentations = SlidingWindowFeature(
+        features["segmentations"].astype(np.float32), SlidingWindow(start=start, duration=duration, step=step)
+    )
+    start, duration, step = features["count_window"].tolist()
+    count = SlidingWindowFeature(
+        np.minimum(features["count"], max_speakers).astype(np.int8), SlidingWindow(start=start, duration=duration, step=step)
+    )
+    
+    # Same binarization the pipeline applied before clustering
+    if pipeline._segmentation.model.specifications.powerset:
+        binarized_segmentations = segmentations
+    else:
+        binarized_segmentations = binarize(segmentations, onset=pipeline.segmentation.threshold, initial_state=False)
+    
+    hard_clusters, _, _ = pipeline.clustering(
+        embeddings=features["embeddings"],
+        segmentations=binarized_segmentations,
+        num_clusters=num_speakers,
+        min_clusters=min_speakers,
+        max_clusters=max_speakers,
+        file={"uri": "recluster"},
+        frames=pipeline._segmentation.model.receptive_field
+    )
+    
+    # Speakers that are never active in a chunk don't take part in the reconstruction
+    inactive_speakers = np.sum(binarized_segmentations.data, axis=1) == 0
+    hard_clusters[inactive_speakers] = -2
+    discrete_diarization = pipeline.reconstruct(segmentations, hard_clusters, count)
+    
+    diarization = pipeline.to_annotation(
+        discrete_diarization, min_duration_on=0.0, min_duration_off=pipeline.segmentation.min_duration_off
+    )
+    mapping = {label: expected_label for label, expected_label in zip(diarization.labels(), pipeline.classes())}
+    diarization = diarization.rename_labels(mapping=mapping)
+    
+    # The features were computed on speech-only input
+    return _annotation_to_original(diarization, TimestampRemap([tuple(span) for span in features["speech_spans"].tolist()]))
+
+def _batched_segmentations(pipeline, inputs):
+    """
+    Run the segmentation model over the sliding windows of many pipeline inputs in shared batches.
+    
+    Windows are cut exactly as the pipeline's own inference cuts them (the last one
+    zero-padded), but a batch is filled from as many inputs as it takes.
+    
+    Returns:
+        One SlidingWindowFeature of (windows, frames, local speakers) per input
+    """
+    inference = pipeline._segmentation
+    sample_rate = inputs[0]["sample_rate"] if inputs else DecodedAudio.sample_rate
+    window_samples = int(round(inference.duration * sample_rate))
+    step_samples = int(round(inference.step * sample_rate))
+    
+    def windows_of(waveform):
+        num_samples = waveform.shape[1]
+        full_windows = (num_samples - window_samples) // step_samples + 1 if num_samples >= window_samples else 0
+        for i in range(full_windows):
+            yield waveform[:, i * step_samples:i * step_samples + window_samples]
+        if num_samples < window_samples or (num_samples - window_samples) % step_samples > 0:
+            last = waveform[:, full_windows * step_samples:]
+            yield torch.nn.functional.pad(last, (0, window_samples - last.shape[1]))
+    
+    counts = [0] * len(inputs)
+    outputs = []
+    batch = []
+    for index, pipeline_input in enumerate(inputs):
+        for window in windows_of(pipeline_input["waveform"]):
+            counts[index] += 1
+            batch.append(window)
+            if len(batch) == pipeline.segmentation_batch_size:
+                outputs.append(inference.infer(torch.stack(batch)))
+                batch = []
+    if batch:
+        outputs.append(inference.infer(torch.stack(batch)))
+    
+    data = np.concatenate(outputs) if outputs else np.zeros((0, 0, 0), dtype=np.float32)
+    frames = SlidingWindow(start=0.0, duration=inference.duration, step=inference.step)
+    bounds = np.concatenate(([0], np.cumsum(counts)))
+    return [SlidingWindowFeature(data[first:last], frames) for first, last in zip(bounds[:-1], bounds[1:])]
+
+def _batched_embeddings(pipeline, inputs, binarized_segmentations):
+    """
+    Embed every (window, local speaker) pair of many pipeline inputs in shared batches.
+    
+    Masks are chosen as in the pipeline: overlapped frames are left out when enough
+    single-speaker frames remain and embedding_exclude_overlap is set.
+    
+    Returns:
+        One (windows, local speakers, dimension) array per input
+    """
+    embedding = pipeline._embedding
+    shapes = [segmentations.data.shape for segmentations in binarized_segmentations]
+    
+    def crops():
+        for pipeline_input, segmentations in zip(inputs, binarized_segmentations):
+            waveform = pipeline_input["waveform"]
+            sample_rate = pipeline_input["sample_rate"]
+            num_windows, num_frames, _ = segmentations.data.shape
+            window = segmentations.sliding_window
+            window_samples = int(math.floor(window.duration * sample_rate))
+            min_num_frames = math.ceil(num_frames * embedding.min_num_samples / (window.duration * embedding.sample_rate))
+            
+            masks = np.nan_to_num(segmentations.data, nan=0.0).astype(np.float32)
+            clean_masks = masks * (np.sum(masks, axis=2, keepdims=True) < 2)
+            for i in range(num_windows):
+                first = int(math.floor(window[i].start * sample_rate))
+                chunk = waveform[:, first:first + window_samples]
+                chunk = torch.nn.functional.pad(chunk, (0, window_samples - chunk.shape[1]))
+                for mask, clean_mask in zip(masks[i].T, clean_masks[i].T):
+                    if pipeline.embedding_exclude_overlap and np.sum(clean_mask) > min_num_frames:
+                        mask = clean_mask
+                    yield chunk, torch.from_numpy(np.ascontiguousarray(mask))
+    
+    outputs = []
+    batch = []
+    for chunk, mask in crops():
+        batch.append((chunk, mask))
+        if len(batch) == pipeline.embedding_batch_size:
+            outputs.append(embedding(torch.stack([c for c, _ in batch]), masks=torch.stack([m for _, m in batch])))
+            batch = []
+    if batch:
+        outputs.append(embedding(torch.stack([c for c, _ in batch]), masks=torch.stack([m for _, m in batch])))
+    
+    data = np.concatenate(outputs) if outputs else np.zeros((0, embedding.dimension), dtype=np.float32)
+    results = []
+    first = 0
+    for num_windows, _, num_speakers in shapes:
+        last = first + num_windows * num_speakers
+        results.append(data[first:last].reshape(num_windows, num_speakers, -1))
+        first = last
+    return results
+
+def _diarize_batch(pipeline, audios):
+    """
+    Diarize many DecodedAudio at once, sharing segmentation and embedding batches between them.
+    
+    Only the inference is shared; counting, clustering and reconstruction run per file on
+    its own slice of the results, exactly as _recluster_diarization does.
+    
+    Returns:
+        List of (annotation, features) tuples in the order of audios, as from _run_diarization
+    """
+    speech = [audio.speech_input() for audio in audios]
+    inputs = [pipeline_input for pipeline_input, _ in speech]
+    
+    segmentations = _batched_segmentations(pipeline, inputs)
+    if pipeline._segmentation.model.specifications.powerset:
+        binarized = segmentations
+    else:
+        binarized = [
+            binarize(segmentation, onset=pipeline.segmentation.threshold, initial_state=False)
+            for segmentation in segmentations
+        ]
+    embeddings = _batched_embeddings(pipeline, inputs, binarized)
+    
+    results = []
+    for (_, remap), segmentation, binarized_segmentation, file_embeddings in zip(speech, segmentations, binarized, embeddings):
+        count = pipeline.speaker_count(binarized_segmentation, pipeline._segmentation.model.receptive_field, warm_up=(0.0, 0.0))
+        if len(count.data) == 0 or np.nanmax(count.data) == 0.0:
+            # Nobody speaks
+            results.append((Annotation(), None))
+            continue
+        features = {
+            "segmentations": segmentation.data.astype(np.float16),
+            "segmentations_window": np.array([segmentation.sliding_window.start, segmentation.sliding_window.duration, segmentation.sliding_window.step]),
+            "count": count.data.astype(np.int8),
+            "count_window": np.array([count.sliding_window.start, count.sliding_window.duration, count.sliding_window.step]),
+            "embeddings": np.asarray(file_embeddings, dtype=np.float32),
+            "speech_spans": np.array(remap.spans, dtype=np.float64)
+        }
+        results.append((_recluster_diarization(pipeline, features), features))
+    return results
+
+def _diarize_two_speakers(pipeline, audio):
+    """
+    Diarize a two-person recording from the segmentation model's frame activations alone.
+    
+    No embeddings are extracted and nothing is clustered: each window's local speakers are
+    linked to the two call parties by how well they agree with the activations already
+    stitched together on the frames the windows share, then the windows are averaged
+    frame by frame and thresholded.
+    """
+    from scipy.optimize import linear_sum_assignment
+    
+    speech, remap = audio.speech_input()
+    segmentations = pipeline._segmentation(speech)
+    windows = segmentations.sliding_window
+    data = np.nan_to_num(segmentations.data.astype(np.float32))  # (windows, frames, local speakers)
+    num_windows, num_frames, num_local = data.shape
+    frame_step = windows.duration / num_frames
+    
+    offsets = np.round((windows.start + np.arange(num_windows) * windows.step) / frame_step).astype(int)
+    sums = np.zeros((offsets[-1] + num_frames, 2), dtype=np.float32)
+    counts = np.zeros(offsets[-1] + num_frames, dtype=np.float32)
+    
+    for window, offset in zip(data, offsets):
+        frames = slice(offset, offset + num_frames)
+        seen = counts[frames] > 0
+        scores = np.zeros((num_local, 2), dtype=np.float32)
+        if seen.any():
+            # Cosine agreement of each local speaker with each party on the frames already stitched
+            reference = sums[frames][seen] / counts[frames][seen, None]
+            local = window[seen]
+            norms = np.outer(np.linalg.norm(local, axis=0), np.linalg.norm(reference, axis=0))
+            scores = (local.T @ reference) / np.maximum(norms, 1e-6)
+        
+        if scores.max() > 0:
+            # The two most active local speakers take one party each, so a voice heard for the
+            # first time gets the party the other one doesn't have
+            main_speakers = np.argsort(-window.sum(axis=0))[:2]
+            rows, cols = linear_sum_assignment(-scores[main_speakers])
+            assignment = np.argmax(scores, axis=1)  # an extra local speaker joins the party it resembles
+            assignment[main_speakers[rows]] = cols
+        else:
+            # Nothing to link to (first window or silence before it): most active speaker first
+            assignment = np.ones(num_local, dtype=int)
+            assignment[np.argmax(window.sum(axis=0))] = 0
+        
+        parties = np.zeros((num_frames, 2), dtype=np.float32)
+        for speaker, party in enumerate(assignment):
+            parties[:, party] = np.maximum(parties[:, party], window[:, speaker])
+        sums[frames] += parties
+        counts[frames] += 1
+    
+    active = sums / np.maximum(counts, 1)[:, None] >= 0.5
+    annotation = Annotation()
+    for party in range(2):
+        edges = np.flatnonzero(np.diff(np.concatenate(([0], active[:, party].astype(np.int8), [0]))))
+        for start, end in zip(edges[0::2], edges[1::2]):
+            segment = Segment(start * frame_step, end * frame_step)
+            annotation[segment, annotation.new_track(segment)] = f"SPEAKER_{party:02d}"
+    
+    # Bridge the short gaps a single speaker's turn is broken into
+    annotation = annotation.support(collar=DIARIZATION_TWO_SPEAKER_MIN_OFF)
+    return _annotation_to_original(annotation, remap)
 
+# Speaker embedding models, loaded once per process
+_embedding_models = {}
 
-def main():
-    # Check if we're running in CLI mode explicitly
-    if "--cli" in sys.argv:
-        run_cli()
-        return 0
+def _speaker_embedding_model(token=None, device="cpu"):
+    """Return the shared PretrainedSpeakerEmbedding model for a device."""
+    if device not in _embedding_models:
+        model = PretrainedSpeakerEmbedding(
+            DIARIZATION_EMBEDDING_MODEL, device=torch.device(device), use_auth_token=token
+        )
+        if device == "cpu" and diarization_pipelines.cpu_mode:
+            _quantize_speaker_embedding(model)
+        _embedding_models[device] = model
+    return _embedding_models[device]
+
+def _speaker_centroids(waveform, sample_rate, turns, token=None):
+    """
+    Compute one centroid embedding per speaker from their longest turns.
     
-    # Check if wxPython is available
-    if not WX_AVAILABLE:
-        print("wxPython is not available. Running in CLI mode.")
-        run_cli()
-        return 0
+    Args:
+        waveform: (1, samples) tensor of the diarized window
+        sample_rate: Sample rate of the waveform
+        turns: List of (start, end, speaker) turns relative to the window
     
-    # Try to run in GUI mode
-    try:
-        app = MainApp()
-        app.MainLoop()
-        return 0
-    except Exception as e:
-        print(f"Error starting application: {e}")
-        print("Falling back to CLI mode.")
-        run_cli()
-        return 1
+    Returns:
+        Dictionary mapping each speaker to an L2-normalized numpy vector
+    """
+    model = _speaker_embedding_model(token)
+    max_samples = int(DIARIZATION_EMBEDDING_MAX_TURN * sample_rate)
+    
+    centroids = {}
+    for speaker in set(speaker for _, _, speaker in turns):
+        # Longest turns carry the cleanest voice print
+        spans = sorted(
+            ((turn_start, turn_end) for turn_start, turn_end, label in turns
+             if label == speaker and turn_end - turn_start >= DIARIZATION_EMBEDDING_MIN_TURN),
+            key=lambda span: span[0] - span[1]
+        )[:DIARIZATION_EMBEDDING_TURNS]
+        if not spans:
+            continue
+        
+        # Pad the turns to one length and mask the padding
+        pieces = [waveform[0, int(a * sample_rate):int(b * sample_rate)][:max_samples] for a, b in spans]
+        length = max(len(piece) for piece in pieces)
+        batch = torch.zeros(len(pieces), 1, length)
+        masks = torch.zeros(len(pieces), length)
+        for i, piece in enumerate(pieces):
+            batch[i, 0, :len(piece)] = piece
+            masks[i, :len(piece)] = 1.0
+        
+        embeddings = model(batch, masks=masks)
+        embeddings = embeddings[~np.isnan(embeddings).any(axis=1)]
+        if len(embeddings) == 0:
+            continue
+        embeddings /= np.linalg.norm(embeddings, axis=1, keepdims=True)
+        centroid = embeddings.mean(axis=0)
+        centroids[speaker] = centroid / np.linalg.norm(centroid)
+    return centroids
+
+def _speaker_voiceprints(audio, diarization, token=None):
+    """Compute one centroid embedding per speaker of a whole-recording diarization of DecodedAudio."""
+    waveform, sample_rate = audio.waveform(), audio.sample_rate
+    turns = [
+        (segment.start, segment.end, speaker)
+        for segment, _, speaker in diarization.itertracks(yield_label=True)
+    ]
+    return _speaker_centroids(waveform, sample_rate, turns, token)
+
+class SpeakerLibrary:
+    """
+    Persistent library of named voiceprints used to recognise recurring speakers.
+    
+    Every person has one L2-normalized embedding, the running mean of the speakers
+    that were given their name. The voiceprints form a single float32 matrix, so
+    matching all speakers of a recording against everyone known is one matrix
+    product followed by a one-to-one assignment.
+    """
+    def __init__(self, path=None, threshold=SPEAKER_LIBRARY_SIMILARITY):
+        if path is None:
+            # Use APP_BASE_DIR if available
+            if APP_BASE_DIR:
+                path = os.path.join(APP_BASE_DIR, "speaker_library.npz")
+            else:
+                path = "speaker_library.npz"
+        self.path = path
+        self.threshold = threshold
+        self._lock = threading.Lock()
+        self._names = None  # Person names, in the row order of self._vectors
+        self._vectors = None  # (people, dimension) float32 matrix of voiceprints
+        self._counts = None  # Number of speakers averaged into each voiceprint
+    
+    def _ensure_loaded(self):
+        """Read the library from disk on first use."""
+        if self._names is not None:
+            return
+        
+        self._names, self._vectors, self._counts = [], None, np.zeros(0, dtype=np.int32)
+        try:
+            with np.load(self.path, allow_pickle=False) as data:
+                if str(data["model"]) != DIARIZATION_EMBEDDING_MODEL:
+                    # Voiceprints from another embedding model can't be compared
+                    print(f"Ignoring speaker library built with {data['model']}")
+                    return
+                self._names = [str(name) for name in data["names"]]
+                self._vectors = data["vectors"].astype(np.float32)
+                self._counts = data["counts"].astype(np.int32)
+        except (OSError, KeyError, ValueError):
+            pass
+    
+    def match(self, voiceprints):
+        """
+        Match diarized speakers to known people.
+        
+        Args:
+            voiceprints: Dictionary mapping speaker labels to L2-normalized embeddings
+        
+        Returns:
+            Dictionary mapping each recognised speaker label to a person's name
+        """
+        from scipy.optimize import linear_sum_assignment
+        
+        with self._lock:
+            self._ensure_loaded()
+            if not voiceprints or not self._names:
+                return {}
+            
+            labels = list(voiceprints)
+            queries = np.stack([voiceprints[label] for label in labels]).astype(np.float32)
+            similarity = queries @ self._vectors.T
+            
+            # Two speakers of one recording are never the same person
+            matches = {}
+            for row, column in zip(*linear_sum_assignment(-similarity)):
+                if similarity[row, column] >= self.threshold:
+                    matches[labels[row]] = self._names[column]
+            return matches
+    
+    def enroll(self, name, voiceprint):
+        """Add a person's voiceprint, or fold it into the one already stored, and save the library."""
+        voiceprint = np.asarray(voiceprint, dtype=np.float32)
+        voiceprint = voiceprint / np.linalg.norm(voiceprint)
+        
+        with self._lock:
+            self._ensure_loaded()
+            if name in self._names:
+                i = self._names.index(name)
+                mean = self._vectors[i] * self._counts[i] + voiceprint
+                self._vectors[i] = mean / np.linalg.norm(mean)
+                self._counts[i] += 1
+            else:
+                self._names.append(name)
+                self._vectors = voiceprint[None, :] if self._vectors is None else np.vstack([self._vectors, voiceprint])
+                self._counts = np.append(self._counts, 1).astype(np.int32)
+            self._save()
+    
+    def _save(self):
+        """Atomically write the library to disk."""
+        try:
+            directory = os.path.dirname(os.path.abspath(self.path))
+            os.makedirs(directory, exist_ok=True)
+            temp_path = f"{self.path}.{uuid.uuid4().hex}.tmp"
+            with open(temp_path, "wb") as f:
+                np.savez(
+                    f,
+                    model=np.array(DIARIZATION_EMBEDDING_MODEL),
+                    names=np.array(self._names, dtype=np.str_),
+                    vectors=self._vectors,
+                    counts=self._counts
+                )
+            os.replace(temp_path, self.path)
+        except Exception as e:
+            print(f"Error saving speaker library: {e}")
 
 class AudioProcessor:
     """Audio processing functionality for transcription and diarization."""
@@ -355,6 +2556,22 @@ class AudioProcessor:
         self.update_callback = update_callback
         self.config_manager = config_manager
         self.transcript = None  # Initialize transcript attribute
+        self.transcript_response = None  # Verbose response with word and segment timestamps
+        self.word_timeline = None  # WordTimeline of the last transcript, used for diarization mapping
+        self.cache = TranscriptionCache()
+        self.diarization_cache = DiarizationCache()
+        self.set_backend()
+    
+    def set_backend(self, name=None):
+        """Select the transcription engine: "openai" (default) or "local"."""
+        if name is None and self.config_manager:
+            name = self.config_manager.get_transcription_backend()
+        
+        if name == LocalWhisperBackend.name:
+            model_name = self.config_manager.get_local_whisper_model() if self.config_manager else LOCAL_WHISPER_MODEL
+            self.backend = LocalWhisperBackend(model_name)
+        else:
+            self.backend = OpenAIWhisperBackend(self.client)
     
     def update_status(self, message, percent=None):
         """Update status with message and optional progress percentage."""
@@ -362,31 +2579,304 @@ class AudioProcessor:
             self.update_callback(message, percent)
     
     def transcribe_audio(self, audio_path, language=None):
-        """Transcribe audio file using OpenAI's Whisper API."""
+        """Transcribe audio file using the selected transcription backend."""
         try:
-            if not self.client:
+            if self.backend.name == OpenAIWhisperBackend.name and not self.client:
                 error_msg = "Error: OpenAI client not initialized"
                 self.transcript = error_msg
                 return error_msg
             
-            self.update_status("Transcribing audio...", percent=10)
-            
-            with open(audio_path, "rb") as audio_file:
-                response = self.client.audio.transcriptions.create(
-                    file=audio_file,
-                    model=WHISPER_MODEL,
-                    language=language
-                )
-            
-            self.update_status("Transcription complete", percent=100)
-            self.transcript = response.text  # Store the transcript as an attribute
-            return response.text
+            return self._set_transcript(self.transcribe(audio_path, language))
         except Exception as e:
             error_msg = f"Error: {str(e)}"
             self.update_status(f"Error transcribing audio: {str(e)}", percent=0)
             self.transcript = error_msg  # Set transcript to error message to avoid None
             return error_msg
-            
+    
+    def transcribe(self, audio_path, language=None):
+        """
+        Transcribe an audio file and return the verbose response, raising on errors.
+        
+        Unlike transcribe_audio this doesn't change the current transcript, so it
+        can run alongside other work on the same processor.
+        """
+        if self.backend.name == OpenAIWhisperBackend.name and not self.client:
+            raise ValueError("OpenAI client not initialized")
+        
+        # Reuse an earlier transcription of the same audio content if there is one
+        verbose_key = self.cache.make_key(audio_path, language, self.backend.model, ["word", "segment"])
+        cached = self.cache.get(verbose_key)
+        if cached is not None:
+            self.update_status("Loaded transcript from cache", percent=100)
+            return cached
+        
+        # Audio is downmixed, trimmed, compressed and split at silences before transcription
+        self.update_status("Preparing audio...", percent=5)
+        parts = self._prepare_upload_parts(audio_path)
+        self.update_status(f"Transcribing {len(parts)} chunk(s) with {self.backend.label}...", percent=10)
+        
+        responses = self.backend.transcribe_many(
+            [upload for _, upload in parts],
+            language,
+            progress_callback=lambda completed, total: self.update_status(
+                f"Transcribed chunk {completed}/{total}...", percent=10 + int(85 * completed / total)
+            )
+        )
+        response = self._merge_verbose_responses(
+            [(remap, result) for (remap, _), result in zip(parts, responses)]
+        )
+        
+        self.cache.put(verbose_key, response)
+        self.update_status("Transcription complete", percent=100)
+        return response
+    
+    def _set_transcript(self, response):
+        """Keep a verbose transcription as the current transcript and return its text."""
+        self.transcript_response = response
+        self.word_timeline = WordTimeline.from_response(response)
+        self.transcript = response.text
+        return response.text
+    
+    def _prepare_upload_parts(self, audio_path):
+        """
+        Prepare everything that has to be uploaded for one file, without sending it.
+        
+        Returns:
+            List of (TimestampRemap, upload) tuples, one per chunk, in playback order
+        """
+        if self.backend.decodes_locally and self._is_ffmpeg_available():
+            return self._prepare_local_parts(audio_path)
+        
+        if not self._is_ffmpeg_available():
+            if os.path.getsize(audio_path) > WHISPER_MAX_UPLOAD_MB * 1024 * 1024:
+                raise ValueError(
+                    f"FFmpeg is required to transcribe files larger than {WHISPER_MAX_UPLOAD_MB}MB.\n\n"
+                    f"{self._get_ffmpeg_install_instructions()}"
+                )
+            with open(audio_path, "rb") as audio_file:
+                return [(TimestampRemap.from_spans(None), (os.path.basename(audio_path), audio_file.read()))]
+        
+        duration = self._get_audio_duration(audio_path)
+        silences = self._detect_silences(audio_path)
+        chunks = self._plan_chunks(duration, silences) if duration > WHISPER_CHUNK_SECONDS else [(0.0, duration)]
+        
+        def encode(chunk):
+            start, end = chunk
+            keep_spans = self._speech_spans(silences, start, end)
+            upload = self._encode_for_upload(audio_path, start, end - start, keep_spans)
+            return TimestampRemap.from_spans(keep_spans, start), upload
+        
+        # Each chunk is encoded by its own FFmpeg process
+        import concurrent.futures
+        with concurrent.futures.ThreadPoolExecutor(max_workers=min(len(chunks), os.cpu_count() or 4)) as executor:
+            return list(executor.map(encode, chunks))
+    
+    def _prepare_local_parts(self, audio_path):
+        """
+        Cut a file into the same chunks and speech spans as the uploads, as 16 kHz float32 samples.
+        
+        Backends that run on this machine read the decoded WAV from convert_to_wav directly
+        instead of the lossy low-bitrate Opus made for uploading.
+        
+        Returns:
+            List of (TimestampRemap, samples) tuples, one per chunk, in playback order
+        """
+        audio = DecodedAudio.load(audio_path)
+        silences = self._detect_silences(audio_path)
+        duration = audio.duration
+        chunks = self._plan_chunks(duration, silences) if duration > WHISPER_CHUNK_SECONDS else [(0.0, duration)]
+        
+        parts = []
+        for start, end in chunks:
+            keep_spans = self._speech_spans(silences, start, end)
+            samples = np.concatenate([audio.crop(a, b) for a, b in keep_spans or [(start, end)]])
+            parts.append((TimestampRemap.from_spans(keep_spans, start), samples))
+        return parts
+    
+    def _speech_spans(self, silences, start, end):
+        """
+        Return the parts of [start, end] to keep when long silences are cut out.
+        
+        Silences shorter than SILENCE_TRIM_MIN_SECONDS are kept as natural pauses, and
+        SILENCE_TRIM_PADDING seconds are left on both sides of every cut so word edges
+        aren't clipped. Returns None when trimming is disabled or nothing would be cut.
+        """
+        if self.config_manager and not self.config_manager.get_trim_silence():
+            return None
+        
+        spans = []
+        position = start
+        for silence_start, silence_end in silences:
+            cut_start = max(silence_start + SILENCE_TRIM_PADDING, start)
+            cut_end = min(silence_end - SILENCE_TRIM_PADDING, end)
+            if silence_end - silence_start < SILENCE_TRIM_MIN_SECONDS or cut_end - cut_start <= 0:
+                continue
+            if cut_start > position:
+                spans.append((position, cut_start))
+            position = max(position, cut_end)
+        if end > position:
+            spans.append((position, end))
+        
+        if len(spans) == 1 and spans[0] == (start, end):
+            return None
+        return spans
+    
+    def _encode_for_upload(self, audio_path, start=None, duration=None, keep_spans=None):
+        """
+        Downmix audio to 16 kHz mono and encode it as Opus, streaming through FFmpeg.
+        
+        The encoded bytes are read straight from FFmpeg's stdout, so no intermediate
+        file is written. Speech needs far less than the bitrate of a typical WAV or
+        M4A recording, which cuts upload size by roughly an order of magnitude.
+        
+        Args:
+            audio_path: Path to the source audio file
+            start: Optional offset in seconds to start encoding from
+            duration: Optional number of seconds to encode
+            keep_spans: Optional list of (start, end) spans in original-audio time to keep;
+                everything between them is dropped from the encoded audio
+        
+        Returns:
+            (filename, bytes, content_type) tuple accepted by the OpenAI client
+        """
+        command = ["ffmpeg", "-v", "error", "-nostdin"]
+        if start is not None:
+            command += ["-ss", f"{start:.3f}"]
+        if duration is not None:
+            command += ["-t", f"{duration:.3f}"]
+        command += ["-i", audio_path]
+        
+        if keep_spans:
+            # Input seeking resets timestamps to zero, so spans are made relative to start
+            offset = start or 0.0
+            selection = "+".join(
+                f"between(t,{span_start - offset:.3f},{span_end - offset:.3f})"
+                for span_start, span_end in keep_spans
+            )
+            command += ["-af", f"aselect='{selection}',asetpts=N/SR/TB"]
+        
+        command += [
+            "-vn", "-ac", "1", "-ar", "16000",
+            "-c:a", "libopus", "-b:a", UPLOAD_AUDIO_BITRATE, "-application", "voip",
+            "-f", "ogg", "pipe:1"
+        ]
+        
+        result = subprocess.run(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE, check=True)
+        
+        filename = os.path.splitext(os.path.basename(audio_path))[0] + ".ogg"
+        return (filename, result.stdout, "audio/ogg")
+    
+    def _is_ffmpeg_available(self):
+        """Check if ffmpeg is available on the system."""
+        return shutil.which("ffmpeg") is not None
+    
+    def _get_audio_duration(self, audio_path):
+        """Return the duration of an audio file in seconds."""
+        if LIBROSA_AVAILABLE:
+            try:
+                return librosa.get_duration(path=audio_path)
+            except Exception:
+                pass  # Fall back to ffprobe for formats librosa can't open
+        
+        result = subprocess.run(
+            ["ffprobe", "-v", "error", "-show_entries", "format=duration",
+             "-of", "default=noprint_wrappers=1:nokey=1", audio_path],
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            text=True,
+            check=True
+        )
+        return float(result.stdout.strip())
+    
+    def _detect_silences(self, audio_path, noise_db=-35, min_silence=0.5):
+        """Return (start, end) pairs of silent stretches found by FFmpeg's silencedetect filter."""
+        result = subprocess.run(
+            ["ffmpeg", "-hide_banner", "-nostats", "-i", audio_path,
+             "-af", f"silencedetect=noise={noise_db}dB:d={min_silence}", "-f", "null", "-"],
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            text=True,
+            errors="replace"
+        )
+        
+        silences = []
+        silence_start = None
+        for line in result.stderr.splitlines():
+            match = re.search(r"silence_start: (-?[\d.]+)", line)
+            if match:
+                silence_start = max(0.0, float(match.group(1)))
+                continue
+            match = re.search(r"silence_end: ([\d.]+)", line)
+            if match and silence_start is not None:
+                silences.append((silence_start, float(match.group(1))))
+                silence_start = None
+        
+        return silences
+    
+    def _plan_chunks(self, duration, silences, max_chunk=WHISPER_CHUNK_SECONDS):
+        """Choose chunk boundaries, cutting in the middle of the last silence before each size limit."""
+        cut_points = [(start + end) / 2 for start, end in silences]
+        
+        chunks = []
+        chunk_start = 0.0
+        while duration - chunk_start > max_chunk:
+            limit = chunk_start + max_chunk
+            # Only accept silences in the second half so chunks don't get too small
+            candidates = [p for p in cut_points if chunk_start + max_chunk / 2 < p <= limit]
+            chunk_end = max(candidates) if candidates else limit
+            chunks.append((chunk_start, chunk_end))
+            chunk_start = chunk_end
+        chunks.append((chunk_start, duration))
+        
+        return chunks
+    
+    def _merge_verbose_responses(self, parts):
+        """
+        Merge verbose_json chunk transcriptions into a single response on the original timeline.
+        
+        Args:
+            parts: List of (TimestampRemap, response) tuples in playback order
+        
+        Returns:
+            TranscriptionVerbose with word and segment timestamps in original-audio time
+        """
+        from openai.types.audio import TranscriptionVerbose
+        
+        texts = []
+        words = []
+        segments = []
+        language = None
+        duration = 0.0
+        
+        for remap, response in parts:
+            data = response.model_dump() if hasattr(response, "model_dump") else dict(response)
+            language = language or data.get("language")
+            
+            if data.get("text"):
+                texts.append(data["text"].strip())
+            
+            for word in data.get("words") or []:
+                word["start"] = remap.to_original(word["start"])
+                word["end"] = remap.to_original(word["end"], is_end=True)
+                words.append(word)
+            
+            for segment in data.get("segments") or []:
+                segment["id"] = len(segments)
+                segment["start"] = remap.to_original(segment["start"])
+                segment["end"] = remap.to_original(segment["end"], is_end=True)
+                segment["seek"] = int(segment["start"] * 100)  # seek is in 10ms frames
+                segments.append(segment)
+            
+            duration = max(duration, remap.to_original(float(data.get("duration") or 0), is_end=True))
+        
+        return TranscriptionVerbose.model_validate({
+            "text": " ".join(texts),
+            "language": language or "",
+            "duration": duration,
+            "words": words,
+            "segments": segments
+        })
+    
     def _get_ffmpeg_install_instructions(self):
         """Return platform-specific FFmpeg installation instructions."""
         import platform
@@ -401,6 +2891,483 @@ class AudioProcessor:
         else:
             return "Please download FFmpeg from https://ffmpeg.org/download.html"
 
+class BatchTranscriber:
+    """Transcribes many audio files concurrently using the async OpenAI client."""
+    def __init__(self, api_key, audio_processor, language=None, concurrency=BATCH_TRANSCRIBE_CONCURRENCY,
+                 progress_callback=None, output_dir=None):
+        self.api_key = api_key
+        self.audio_processor = audio_processor
+        self.language = language
+        self.concurrency = max(1, int(concurrency))
+        self.progress_callback = progress_callback
+        
+        if output_dir is None:
+            # Use APP_BASE_DIR if available
+            output_dir = os.path.join(APP_BASE_DIR, "Transcripts") if APP_BASE_DIR else "Transcripts"
+        self.output_dir = output_dir
+        self._output_names = {}
+    
+    @staticmethod
+    def collect_audio_files(paths):
+        """Expand a list of files and folders into the supported audio files they contain."""
+        if isinstance(paths, str):
+            paths = [paths]
+        
+        files = []
+        for path in paths:
+            if os.path.isdir(path):
+                for name in sorted(os.listdir(path)):
+                    file_path = os.path.join(path, name)
+                    if os.path.isfile(file_path) and os.path.splitext(name)[1].lower() in SUPPORTED_AUDIO_FORMATS:
+                        files.append(file_path)
+            elif os.path.isfile(path):
+                files.append(path)
+        return files
+    
+    def run(self, paths):
+        """
+        Transcribe all files and block until they are done.
+        
+        Args:
+            paths: Audio files and/or folders to transcribe
+        
+        Returns:
+            Dictionary mapping each file path to its transcript text, or to the Exception it failed with
+        """
+        files = self.collect_audio_files(paths)
+        return asyncio.run(self._run(files))
+    
+    async def _run(self, files):
+        """Transcribe files with at most self.concurrency Whisper requests in flight."""
+        semaphore = asyncio.Semaphore(self.concurrency)
+        self._output_names = self._transcript_names(files)
+        
+        # Only the OpenAI backend needs the async client; other backends run in worker threads
+        async_client = None
+        if self.audio_processor.backend.name == OpenAIWhisperBackend.name:
+            async_client = AsyncOpenAI(api_key=self.api_key, max_retries=0)
+        
+        try:
+            results = await asyncio.gather(
+                *(self._transcribe_file(async_client, semaphore, path) for path in files)
+            )
+        finally:
+            if async_client:
+                await async_client.close()
+        return dict(zip(files, results))
+    
+    async def _transcribe_file(self, async_client, semaphore, path):
+        """Transcribe one file, reporting progress and returning its text or the exception."""
+        self._report(path, "queued")
+        cache = self.audio_processor.cache
+        
+        try:
+            cache_key = await asyncio.to_thread(
+                cache.make_key, path, self.language, self.audio_processor.backend.model, ["word", "segment"]
+            )
+            cached = cache.get(cache_key)
+            if cached is not None:
+                self._save_transcript(path, cached.text)
+                self._report(path, "cached", cached.text)
+                return cached.text
+            
+            # FFmpeg encoding runs in worker threads so it doesn't block the event loop
+            self._report(path, "preparing")
+            parts = await asyncio.to_thread(self.audio_processor._prepare_upload_parts, path)
+            
+            self._report(path, "transcribing")
+            if async_client:
+                responses = await asyncio.gather(
+                    *(self._send(async_client, semaphore, upload) for _, upload in parts)
+                )
+            else:
+                async with semaphore:
+                    responses = await asyncio.to_thread(
+                        self.audio_processor.backend.transcribe_many, [upload for _, upload in parts], self.language
+                    )
+            response = self.audio_processor._merge_verbose_responses(
+                [(remap, result) for (remap, _), result in zip(parts, responses)]
+            )
+            
+            cache.put(cache_key, response)
+            self._save_transcript(path, response.text)
+            self._report(path, "done", response.text)
+            return response.text
+        except Exception as e:
+            self._report(path, "error", str(e))
+            return e
+    
+    async def _send(self, async_client, semaphore, upload):
+        """Send one upload to Whisper once a concurrency slot is free."""
+        async with semaphore:
+            return await openai_scheduler.acall(
+                async_client.audio.transcriptions.create,
+                file=upload,
+                model=WHISPER_MODEL,
+                language=self.language,
+                response_format="verbose_json",
+                timestamp_granularities=["word", "segment"]
+            )
+    
+    @staticmethod
+    def _transcript_names(files):
+        """
+        Name each file's transcript after the file, keeping names unique within the batch.
+        
+        Files that share a name (a/meeting.mp3 and b/meeting.m4a) get a short hash of
+        their full path appended, so they don't overwrite each other's transcripts.
+        """
+        stems = {path: os.path.splitext(os.path.basename(path))[0] for path in files}
+        # Compare case-insensitively, as Windows and macOS file systems do
+        counts = {}
+        for stem in stems.values():
+            counts[stem.lower()] = counts.get(stem.lower(), 0) + 1
+        
+        names = {}
+        for path, stem in stems.items():
+            if counts[stem.lower()] > 1:
+                path_hash = hashlib.sha1(os.path.abspath(path).encode("utf-8")).hexdigest()[:8]
+                stem = f"{stem}_{path_hash}"
+            names[path] = stem
+        return names
+    
+    def _save_transcript(self, path, text):
+        """Write a transcript next to the others in the Transcripts directory."""
+        try:
+            os.makedirs(self.output_dir, exist_ok=True)
+            name = self._output_names.get(path) or os.path.splitext(os.path.basename(path))[0]
+            with open(os.path.join(self.output_dir, f"{name}.txt"), "w", encoding="utf-8") as f:
+                f.write(text)
+        except Exception as e:
+            print(f"Error saving transcript for {path}: {e}")
+    
+    def _report(self, path, status, detail=None):
+        """Send a progress update for one file."""
+        if self.progress_callback:
+            self.progress_callback(path, status, detail)
+
+class BatchDiarizer:
+    """
+    Diarizes many audio files with one loaded pipeline and model batches shared across files.
+    
+    Files are taken in rounds of about DIARIZATION_BULK_ROUND_SECONDS of audio. Each round's
+    segmentation windows and embedding crops go through the models in full-size batches,
+    so a queue of short clips isn't slowed down by half-empty batches and per-file calls.
+    """
+    def __init__(self, token, model="pyannote/speaker-diarization@2.1", params=None, diarization_cache=None,
+                 progress_callback=None, round_seconds=DIARIZATION_BULK_ROUND_SECONDS):
+        self.token = token
+        self.model = model
+        self.params = params
+        self.diarization_cache = diarization_cache if diarization_cache is not None else DiarizationCache()
+        self.progress_callback = progress_callback
+        self.round_seconds = round_seconds
+    
+    def run(self, paths):
+        """
+        Diarize all files and block until they are done.
+        
+        Args:
+            paths: Audio files and/or folders to diarize
+        
+        Returns:
+            Dictionary mapping each file path to its Annotation, or to the Exception it failed with
+        """
+        files = BatchTranscriber.collect_audio_files(paths)
+        results = {}
+        cache_params = {"mode": "bulk", "params": self.params, "inference": diarization_pipelines.inference_mode()}
+        
+        pending = []
+        for path in files:
+            try:
+                cache_key = self.diarization_cache.make_key(path, self.model, cache_params)
+                cached = self.diarization_cache.get(cache_key)
+                if cached is not None:
+                    results[path] = cached
+                    self._report(path, "cached")
+                    continue
+                self._report(path, "decoding")
+                pending.append((path, cache_key, DecodedAudio.load(path)))
+            except Exception as e:
+                results[path] = e
+                self._report(path, "error", str(e))
+        
+        if pending:
+            with diarization_pipelines.acquire(self.model, self.token, params=self.params) as pipeline:
+                for batch in self._rounds(pending):
+                    self._diarize_round(pipeline, batch, results, cache_params)
+        
+        return {path: results[path] for path in files}
+    
+    def _rounds(self, pending):
+        """Group decoded files into rounds of roughly round_seconds of audio."""
+        batch, seconds = [], 0.0
+        for item in pending:
+            batch.append(item)
+            seconds += item[2].duration
+            if seconds >= self.round_seconds:
+                yield batch
+                batch, seconds = [], 0.0
+        if batch:
+            yield batch
+    
+    def _diarize_round(self, pipeline, batch, results, cache_params):
+        """Diarize one round of files together and cache each file's result."""
+        for path, _, _ in batch:
+            self._report(path, "diarizing")
+        
+        started = time.perf_counter()
+        try:
+            diarized = _diarize_batch(pipeline, [audio for _, _, audio in batch])
+        except Exception as e:
+            for path, _, _ in batch:
+                results[path] = e
+                self._report(path, "error", str(e))
+            return
+        
+        elapsed = time.perf_counter() - started
+        audio_seconds = sum(audio.duration for _, _, audio in batch)
+        print(f"Bulk diarized {len(batch)} files ({audio_seconds:.0f}s of audio) in {elapsed:.1f}s")
+        
+        for (path, cache_key, _), (annotation, features) in zip(batch, diarized):
+            self.diarization_cache.put(cache_key, annotation)
+            if features is not None:
+                # Features are keyed like the annotation they produced, so re-clustering uses matching ones
+                self.diarization_cache.put_features(
+                    self.diarization_cache.make_key(path, self.model, dict(cache_params, features=True)), features
+                )
+            results[path] = annotation
+            self._report(path, "done", annotation)
+    
+    def _report(self, path, status, detail=None):
+        """Send a progress update for one file."""
+        if self.progress_callback:
+            self.progress_callback(path, status, detail)
+
+class LiveTranscriber:
+    """
+    Transcribes microphone audio while it is being recorded.
+    
+    PyAudio fills a ring buffer from its callback thread. A cutter thread
+    closes a window at the first pause after LIVE_MIN_WINDOW_SECONDS (or at
+    LIVE_MAX_WINDOW_SECONDS if nobody stops talking) and queues it together
+    with LIVE_OVERLAP_SECONDS of the previous window, so words cut at the edge
+    are heard twice. A sender thread transcribes the windows in order and
+    drops segments that belong to the overlap, so the transcript trails real
+    time by roughly one window plus the request latency.
+    """
+    def __init__(self, client, language=None, text_callback=None, status_callback=None,
+                 recording_path=None, sample_rate=LIVE_SAMPLE_RATE, device_index=None):
+        self.client = client
+        self.language = language
+        self.text_callback = text_callback
+        self.status_callback = status_callback
+        self.recording_path = recording_path
+        self.sample_rate = sample_rate
+        self.device_index = device_index
+        
+        self.ring = np.zeros(int(LIVE_RING_SECONDS * sample_rate), dtype=np.int16)
+        self.written = 0  # Total samples received since start
+        self.window_start = 0  # First sample not yet covered by a window
+        self.segments = []  # (start, end, text) in seconds from the start of the recording
+        
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._windows = queue.Queue()
+        self._threads = []
+        self._audio = None
+        self._stream = None
+        self._wav = None
+    
+    @property
+    def transcript(self):
+        """Text transcribed so far."""
+        return " ".join(text for _, _, text in self.segments)
+    
+    def start(self):
+        """Open the microphone and start transcribing in the background."""
+        if not PYAUDIO_AVAILABLE or not NUMPY_AVAILABLE:
+            raise RuntimeError("Live transcription requires PyAudio and NumPy.")
+        
+        if self.recording_path:
+            self._wav = wave.open(self.recording_path, "wb")
+            self._wav.setnchannels(1)
+            self._wav.setsampwidth(2)
+            self._wav.setframerate(self.sample_rate)
+        
+        self._audio = pyaudio.PyAudio()
+        self._stream = self._audio.open(
+            format=pyaudio.paInt16,
+            channels=1,
+            rate=self.sample_rate,
+            input=True,
+            input_device_index=self.device_index,
+            frames_per_buffer=int(self.sample_rate * LIVE_FRAME_SECONDS),
+            stream_callback=self._on_audio
+        )
+        
+        self._threads = [
+            threading.Thread(target=self._cut_windows, daemon=True),
+            threading.Thread(target=self._send_windows, daemon=True)
+        ]
+        for thread in self._threads:
+            thread.start()
+        self._stream.start_stream()
+        self._status("Recording...")
+    
+    def stop(self):
+        """Stop recording, transcribe what is left and wait for the last window."""
+        try:
+            if self._stream:
+                self._stream.stop_stream()
+                self._stream.close()
+            if self._audio:
+                self._audio.terminate()
+        finally:
+            self._stream = None
+            self._audio = None
+            self._stop_event.set()
+            for thread in self._threads:
+                thread.join()
+            if self._wav:
+                self._wav.close()
+                self._wav = None
+        return self.transcript
+    
+    def _on_audio(self, in_data, frame_count, time_info, status):
+        """PyAudio callback: copy the new samples into the ring buffer."""
+        samples = np.frombuffer(in_data, dtype=np.int16)
+        size = len(self.ring)
+        with self._lock:
+            pos = self.written % size
+            first = min(len(samples), size - pos)
+            self.ring[pos:pos + first] = samples[:first]
+            self.ring[:len(samples) - first] = samples[first:]
+            self.written += len(samples)
+        return (None, pyaudio.paContinue)
+    
+    def _read(self, start, end):
+        """Copy absolute sample range [start, end) out of the ring buffer."""
+        size = len(self.ring)
+        start = max(start, end - size)
+        indices = np.arange(start, end) % size
+        return self.ring[indices]
+    
+    def _cut_windows(self):
+        """Close windows at pauses and queue them for transcription."""
+        saved = 0
+        min_window = int(LIVE_MIN_WINDOW_SECONDS * self.sample_rate)
+        max_window = int(LIVE_MAX_WINDOW_SECONDS * self.sample_rate)
+        overlap = int(LIVE_OVERLAP_SECONDS * self.sample_rate)
+        
+        while True:
+            stopping = self._stop_event.wait(LIVE_POLL_SECONDS)
+            with self._lock:
+                written = self.written
+                # Read from the latest window start so the pause search and the overlap both fit
+                read_from = max(0, min(saved, self.window_start - overlap))
+                samples = self._read(read_from, written)
+            
+            if written > saved:
+                # Keep a full copy of the recording for speaker identification later
+                if self._wav:
+                    self._wav.writeframes(samples[saved - read_from:].tobytes())
+                saved = written
+            
+            pending = written - self.window_start
+            cut = None
+            if stopping:
+                cut = written if pending > 0 else None
+            elif pending >= min_window:
+                offset = self.window_start - read_from
+                cut = self._find_pause(samples[offset + min_window:])
+                if cut is not None:
+                    cut += self.window_start + min_window
+                elif pending >= max_window:
+                    cut = self.window_start + max_window
+            
+            if cut is not None:
+                start = max(0, self.window_start - overlap)
+                audio = samples[start - read_from:cut - read_from]
+                self._windows.put((start, self.window_start - start, audio))
+                self.window_start = cut
+            
+            if stopping:
+                self._windows.put(None)
+                return
+    
+    def _find_pause(self, samples):
+        """Return the sample offset in the middle of the first pause in samples, or None."""
+        frame = int(self.sample_rate * LIVE_FRAME_SECONDS)
+        frames = len(samples) // frame
+        if frames == 0:
+            return None
+        
+        rms = np.sqrt(np.mean(samples[:frames * frame].reshape(frames, frame).astype(np.float32) ** 2, axis=1))
+        # Frames close to the noise floor count as silence, but never more than a quarter of the typical level
+        threshold = max(LIVE_SILENCE_RMS, min(2.0 * float(np.percentile(rms, 10)), 0.25 * float(np.median(rms))))
+        needed = max(1, int(LIVE_PAUSE_SECONDS / LIVE_FRAME_SECONDS))
+        
+        run = 0
+        for i, quiet in enumerate(rms < threshold):
+            run = run + 1 if quiet else 0
+            if run >= needed:
+                return (i + 1 - run // 2) * frame
+        return None
+    
+    def _send_windows(self):
+        """Transcribe queued windows in order and report the new text."""
+        while True:
+            item = self._windows.get()
+            if item is None:
+                return
+            start, overlap, audio = item
+            
+            try:
+                self._transcribe_window(start / self.sample_rate, overlap / self.sample_rate, audio)
+            except Exception as e:
+                print(f"Error transcribing live audio: {e}")
+                self._status(f"Live transcription error: {str(e)}")
+    
+    def _transcribe_window(self, start, overlap, audio):
+        """Send one window to Whisper and keep the segments that are not in the overlap."""
+        buffer = BytesIO()
+        with wave.open(buffer, "wb") as wav:
+            wav.setnchannels(1)
+            wav.setsampwidth(2)
+            wav.setframerate(self.sample_rate)
+            wav.writeframes(audio.tobytes())
+        
+        # The end of the previous text keeps Whisper's wording consistent across windows
+        previous = self.transcript[-LIVE_PROMPT_CHARS:]
+        response = openai_scheduler.call(
+            self.client.audio.transcriptions.create,
+            file=("live.wav", buffer.getvalue(), "audio/wav"),
+            model=WHISPER_MODEL,
+            language=self.language,
+            prompt=previous or openai.NOT_GIVEN,
+            response_format="verbose_json",
+            timestamp_granularities=["segment"]
+        )
+        
+        new_text = []
+        for segment in response.segments or []:
+            # Segments centred in the overlap were already sent with the previous window
+            if (segment.start + segment.end) / 2 < overlap:
+                continue
+            text = segment.text.strip()
+            if text:
+                self.segments.append((start + segment.start, start + segment.end, text))
+                new_text.append(text)
+        
+        if new_text and self.text_callback:
+            self.text_callback(" ".join(new_text))
+    
+    def _status(self, message):
+        """Send a status message."""
+        if self.status_callback:
+            self.status_callback(message)
+
 class MainApp(wx.App):
     def OnInit(self):
         try:
@@ -432,6 +3399,10 @@ class MainFrame(wx.Frame):
         
         # Initialize config manager
         self.config_manager = ConfigManager(base_dir)
+        openai_scheduler.configure(*self.config_manager.get_rate_limits())
+        diarization_pipelines.configure(self.config_manager.get_diarization_idle_seconds())
+        diarization_pipelines.configure_cpu(*self.config_manager.get_cpu_inference_settings())
+        diarization_pipelines.configure_onnx(self.config_manager.get_diarization_onnx())
         
         # Initialize attributes
         self.client = None
@@ -444,6 +3415,7 @@ class MainFrame(wx.Frame):
         self.speaker_id_help_text = None
         self.transcript = None
         self.last_audio_path = None
+        self.live_transcriber = None
         
         # Check for API key and initialize client
         self.initialize_openai_client()
@@ -451,6 +3423,9 @@ class MainFrame(wx.Frame):
         # Initialize processors
         self.audio_processor = AudioProcessor(client, self.update_status, self.config_manager)
         self.llm_processor = LLMProcessor(client, self.config_manager, self.update_status)
+        self.speaker_library = SpeakerLibrary()
+        self.chunk_planner = DiarizationChunkPlanner()
+        self.speaker_voiceprints = {}
         
         # Set up the UI - use either create_ui or init_ui, not both
         # Initialize menus and status bar using create_ui
@@ -484,7 +3459,7 @@ class MainFrame(wx.Frame):
             dlg.Destroy()
         
         try:
-            client = OpenAI(api_key=api_key)
+            client = OpenAI(api_key=api_key, max_retries=0)
         except Exception as e:
             wx.MessageBox(f"Error initializing OpenAI client: {str(e)}", "Error", wx.OK | wx.ICON_ERROR)
             
@@ -504,6 +3479,8 @@ class MainFrame(wx.Frame):
         audio_menu = wx.Menu()
         upload_audio_item = audio_menu.Append(wx.ID_ANY, "&Upload Audio File", "Upload audio file for transcription")
         self.Bind(wx.EVT_MENU, self.on_upload_audio, upload_audio_item)
+        batch_audio_item = audio_menu.Append(wx.ID_ANY, "&Batch Transcribe Folder", "Transcribe every audio file in a folder")
+        self.Bind(wx.EVT_MENU, self.on_batch_transcribe, batch_audio_item)
         
         file_menu.AppendSubMenu(audio_menu, "&Audio")
         
@@ -624,7 +3601,7 @@ class MainFrame(wx.Frame):
         
         if api_key:
             try:
-                self.client = OpenAI(api_key=api_key)
+                self.client = OpenAI(api_key=api_key, max_retries=0)
                 self.status_bar.SetStatusText("API Key loaded from configuration")
                 return
             except Exception as e:
@@ -643,7 +3620,7 @@ class MainFrame(wx.Frame):
                 self.config_manager.set_api_key(api_key)
                 
                 try:
-                    self.client = OpenAI(api_key=api_key)
+                    self.client = OpenAI(api_key=api_key, max_retries=0)
                     self.status_bar.SetStatusText("API Key saved")
                 except Exception as e:
                     wx.MessageBox(f"Error initializing OpenAI client: {e}", "Error", wx.OK | wx.ICON_ERROR)
@@ -822,6 +3799,39 @@ class MainFrame(wx.Frame):
         
         lang_box_sizer.Add(lang_sizer, flag=wx.EXPAND | wx.ALL, border=5)
         
+        # Transcription engine
+        engine_sizer = wx.BoxSizer(wx.HORIZONTAL)
+        engine_label = wx.StaticText(self.settings_tab, label="Transcription Engine:")
+        self.engine_combo = wx.ComboBox(self.settings_tab,
+                                       choices=[OpenAIWhisperBackend.label, LocalWhisperBackend.label],
+                                       style=wx.CB_READONLY)
+        self.engine_combo.SetSelection(1 if self.config_manager.get_transcription_backend() == LocalWhisperBackend.name else 0)
+        if not TRANSFORMERS_AVAILABLE:
+            self.engine_combo.SetToolTip("Local transcription requires: pip install transformers")
+        
+        engine_sizer.Add(engine_label, flag=wx.ALIGN_CENTER_VERTICAL | wx.RIGHT, border=5)
+        engine_sizer.Add(self.engine_combo, proportion=1)
+        
+        lang_box_sizer.Add(engine_sizer, flag=wx.EXPAND | wx.ALL, border=5)
+        
+        # Two-party calls can skip speaker embeddings entirely
+        self.two_speaker_check = wx.CheckBox(self.settings_tab, label="Two-speaker fast mode (calls with exactly two people)")
+        self.two_speaker_check.SetValue(self.config_manager.get_two_speaker_fast_mode())
+        self.two_speaker_check.SetToolTip("Speaker identification uses only the segmentation model and always finds two speakers")
+        lang_box_sizer.Add(self.two_speaker_check, flag=wx.ALL, border=5)
+        
+        # ONNX Runtime for the diarization models
+        self.onnx_check = wx.CheckBox(self.settings_tab, label="Run diarization models with ONNX Runtime")
+        self.onnx_check.SetValue(self.config_manager.get_diarization_onnx())
+        if ONNXRUNTIME_AVAILABLE:
+            self.onnx_check.SetToolTip("The models are exported to ONNX the first time they are used")
+        else:
+            self.onnx_check.SetLabel("Run diarization models with ONNX Runtime (not installed)")
+            self.onnx_check.SetToolTip("ONNX Runtime requires: pip install onnx onnxruntime")
+            self.onnx_check.SetValue(False)
+            self.onnx_check.Disable()
+        lang_box_sizer.Add(self.onnx_check, flag=wx.ALL, border=5)
+        
         # Save button for settings
         save_button = wx.Button(self.settings_tab, label="Save Settings")
         save_button.Bind(wx.EVT_BUTTON, self.on_save_settings)
@@ -1004,80 +4014,92 @@ class MainFrame(wx.Frame):
             threading.Thread(target=self.transcribe_audio, args=(audio_path,), daemon=True).start()
     
     def transcribe_audio(self, audio_path):
-        if not self.client:
+        """
+        Transcribe an audio file and label its speakers.
+        
+        Transcription and diarization don't depend on each other until their results
+        are merged, so they run side by side and the whole job takes about as long
+        as the slower of the two.
+        """
+        import concurrent.futures
+        
+        if self.audio_processor.backend.name == OpenAIWhisperBackend.name and not self.audio_processor.client:
             wx.CallAfter(self.show_error, "OpenAI API key not set. Please set it in Settings.")
             wx.CallAfter(self.notebook.Enable)
             wx.CallAfter(self.status_bar.SetStatusText, "Error: API key not set")
             return
         
         try:
-            # Step 1: Transcribe audio using OpenAI Whisper
-            language_display = "English" if self.language == "en" else "Hungarian"
-            wx.CallAfter(self.status_bar.SetStatusText, f"Transcribing audio with Whisper in {language_display}...")
+            language_display = "English" if self.language in ("en", "english") else "Hungarian"
+            language_code = {"english": "en", "hungarian": "hu"}.get(self.language, self.language)
+            self.speakers = []
+            self.speaker_voiceprints = {}
             
-            with open(audio_path, "rb") as audio_file:
-                # Send to OpenAI for transcription
-                response = self.client.audio.transcriptions.create(
-                    file=audio_file,
-                    model="whisper-1",
-                    language=self.language,  # Use selected language (en or hu)
-                    response_format="verbose_json",
-                    timestamp_granularities=["word", "segment"]
-                )
+            # Speaker diarization works independently of language
+            hf_token = self.hf_token
+            if DIARIZATION_AVAILABLE and not hf_token:
+                # Ask for HuggingFace token if not present; the dialog starts the run again once it is given
+                wx.CallAfter(self.show_hf_token_dialog)
+                return
+            run_diarization = DIARIZATION_AVAILABLE
             
-            # Get basic transcript
-            self.transcript = response.text
-            self.speakers = []
+            status = f"Transcribing audio with Whisper in {language_display}"
+            wx.CallAfter(self.status_bar.SetStatusText, f"{status} and analyzing speakers..." if run_diarization else f"{status}...")
             
-            # Step 2: Perform speaker diarization if available
-            if DIARIZATION_AVAILABLE:
-                wx.CallAfter(self.status_bar.SetStatusText, "Analyzing speakers...")
+            executor = concurrent.futures.ThreadPoolExecutor(max_workers=2)
+            try:
+                # Branch 1: remote (or local) transcription
+                transcription = executor.submit(self.audio_processor.transcribe, audio_path, language_code)
+                # Branch 2: local diarization
+                diarization = executor.submit(self._diarize_audio, audio_path, hf_token) if run_diarization else None
                 
                 try:
-                    # Check if HuggingFace token exists in environment
-                    hf_token = self.hf_token
-                    
-                    if not hf_token:
-                        # Ask for HuggingFace token if not present
-                        self.show_hf_token_dialog()
-                        return
-                    
-                    # Load the speaker diarization pipeline
-                    # Speaker diarization works independently of language
-                    diarization_pipeline = Pipeline.from_pretrained(
-                        "pyannote/speaker-diarization-3.0",
-                        use_auth_token=hf_token
-                    )
-                    
-                    # Run the diarization pipeline on the audio file
-                    diarization = diarization_pipeline(audio_path)
-                    
-                    # Process diarization results
-                    speaker_segments = {}
-                    
-                    # Extract speaker segments from diarization
-                    for turn, _, speaker in diarization.itertracks(yield_label=True):
-                        if speaker not in self.speakers:
-                            self.speakers.append(speaker)
-                            speaker_segments[speaker] = []
-                        
-                        speaker_segments[speaker].append((turn.start, turn.end))
-                    
-                    # Initialize speaker names with default values - use localized naming
-                    if self.language == "hu":
-                        speaker_prefix = "Beszélő"  # Hungarian for "Speaker"
-                    else:
-                        speaker_prefix = "Speaker"
-                        
-                    self.speaker_names = {speaker: f"{speaker_prefix} {i+1}" for i, speaker in enumerate(self.speakers)}
+                    response = transcription.result()
+                except Exception:
+                    # A failed transcription is reported right away, not after diarization finishes
+                    if diarization is not None:
+                        diarization.cancel()
+                    raise
+                self.transcript = response.text
+                
+                diarization_result = None
+                if diarization is not None:
+                    try:
+                        # Only this thread stores the results, so a run abandoned after a failed transcription can't
+                        diarization_result, self.speaker_voiceprints, self.last_diarization = diarization.result()
+                    except Exception as e:
+                        wx.CallAfter(self.show_error, f"Error during speaker diarization: {str(e)}\nFalling back to basic transcription.")
+            finally:
+                # Never waits: after a successful transcription diarization is already done
+                executor.shutdown(wait=False, cancel_futures=True)
+            
+            if diarization_result is not None:
+                # Process diarization results
+                speaker_segments = {}
+                
+                # Extract speaker segments from diarization
+                for turn, _, speaker in diarization_result.itertracks(yield_label=True):
+                    if speaker not in self.speakers:
+                        self.speakers.append(speaker)
+                        speaker_segments[speaker] = []
                     
-                    # Step 3: Combine transcription with speaker information
-                    formatted_transcript = self.combine_transcript_with_speakers(response, speaker_segments)
-                    self.transcript = formatted_transcript
+                    speaker_segments[speaker].append((turn.start, turn.end))
+                
+                # Initialize speaker names with default values - use localized naming
+                if self.language in ("hu", "hungarian"):
+                    speaker_prefix = "Beszélő"  # Hungarian for "Speaker"
+                else:
+                    speaker_prefix = "Speaker"
                     
-                except Exception as e:
-                    wx.CallAfter(self.show_error, f"Error during speaker diarization: {str(e)}\nFalling back to basic transcription.")
-                    self._fallback_speaker_detection()
+                # People already in the speaker library get their name right away
+                known_speakers = self.speaker_library.match(self.speaker_voiceprints)
+                self.speaker_names = {
+                    speaker: known_speakers.get(speaker, f"{speaker_prefix} {i+1}")
+                    for i, speaker in enumerate(self.speakers)
+                }
+                
+                # Join the two branches: combine transcription with speaker information
+                self.transcript = self.combine_transcript_with_speakers(response, speaker_segments)
             else:
                 # If diarization is not available, use basic speaker detection
                 self._fallback_speaker_detection()
@@ -1094,6 +4116,37 @@ class MainFrame(wx.Frame):
             wx.CallAfter(self.notebook.Enable)
             wx.CallAfter(self.status_bar.SetStatusText, "Error")
     
+    def _diarize_audio(self, audio_path, hf_token):
+        """
+        Diarize an audio file, reusing cached results, and compute each speaker's voiceprint.
+        
+        Runs next to the transcription and leaves the frame's state alone; the caller stores the results.
+        
+        Returns:
+            (diarization, voiceprints, last_diarization) tuple
+        """
+        model = "pyannote/speaker-diarization-3.0"
+        cache_params = {"inference": diarization_pipelines.inference_mode()}
+        last_diarization = {"audio_path": audio_path, "model": model, "params": None, "cache_params": cache_params}
+        diarization_cache = self.audio_processor.diarization_cache
+        cache_key = diarization_cache.make_key(audio_path, model, cache_params)
+        diarization = diarization_cache.get(cache_key)
+        audio = DecodedAudio.load(audio_path)
+        if diarization is None:
+            with diarization_pipelines.acquire(model, hf_token) as diarization_pipeline:
+                diarization, features = _run_diarization(diarization_pipeline, audio)
+            diarization_cache.put(cache_key, diarization)
+            if features is not None:
+                diarization_cache.put_features(diarization_cache.make_key(audio_path, model, dict(cache_params, features=True)), features)
+        
+        # Voiceprints let the speaker library recognise people from earlier recordings
+        try:
+            voiceprints = _speaker_voiceprints(audio, diarization, hf_token)
+        except Exception as e:
+            print(f"Error computing speaker voiceprints: {e}")
+            voiceprints = {}
+        return diarization, voiceprints, last_diarization
+    
     def _fallback_speaker_detection(self):
         """Use a basic approach to detect speakers when diarization is not available"""
         paragraphs = self.transcript.split("\n\n")
@@ -1126,45 +4179,22 @@ class MainFrame(wx.Frame):
         """
         try:
             # Get words with timestamps from Whisper response
-            segments = whisper_response.segments
+            timeline = WordTimeline.from_response(whisper_response)
+            if timeline is None:
+                return whisper_response.text
             
-            # Build a new transcript with speaker information
-            formatted_lines = []
-            current_speaker = None
-            current_line = []
+            # Find which speaker was talking during each word
+            turns = [(start, end, speaker) for speaker, spans in speaker_segments.items() for start, end in spans]
+            labels = timeline.assign_speakers(turns)
             
-            for segment in segments:
-                for word_info in segment.words:
-                    word = word_info.word
-                    start_time = word_info.start
-                    
-                    # Find which speaker was talking at this time
-                    speaker_at_time = None
-                    for speaker, time_segments in speaker_segments.items():
-                        for start, end in time_segments:
-                            if start <= start_time <= end:
-                                speaker_at_time = speaker
-                                break
-                        if speaker_at_time:
-                            break
-                    
-                    # If no speaker found or couldn't determine, use the first speaker
-                    if not speaker_at_time and self.speakers:
-                        speaker_at_time = self.speakers[0]
-                    
-                    # Start a new line if the speaker changes
-                    if speaker_at_time != current_speaker:
-                        if current_line:
-                            formatted_lines.append(f"{self.speaker_names.get(current_speaker, 'Unknown')}: {' '.join(current_line)}")
-                            current_line = []
-                        current_speaker = speaker_at_time
-                    
-                    # Add the word to the current line
-                    current_line.append(word)
+            # If no speaker found or couldn't determine, use the first speaker
+            default_speaker = self.speakers[0] if self.speakers else None
             
-            # Add the last line
-            if current_line:
-                formatted_lines.append(f"{self.speaker_names.get(current_speaker, 'Unknown')}: {' '.join(current_line)}")
+            # Start a new line whenever the speaker changes
+            formatted_lines = [
+                f"{self.speaker_names.get(speaker or default_speaker, 'Unknown')}: {text}"
+                for speaker, text in timeline.group_by_speaker(labels)
+            ]
             
             return "\n\n".join(formatted_lines)
             
@@ -1242,6 +4272,11 @@ class MainFrame(wx.Frame):
                 # Update speaker name
                 self.speaker_names[speaker_id] = new_name
                 self.speaker_list.SetItem(selected, 1, new_name)
+                
+                # Remember the voice so this person is named automatically in later recordings
+                voiceprint = self.speaker_voiceprints.get(speaker_id)
+                if voiceprint is not None:
+                    self.speaker_library.enroll(new_name, voiceprint)
         dialog.Destroy()
     
     def on_regenerate_transcript(self, event):
@@ -1476,7 +4511,7 @@ class MainFrame(wx.Frame):
             # Update client
             if self.api_key:
                 try:
-                    self.client = OpenAI(api_key=self.api_key)
+                    self.client = OpenAI(api_key=self.api_key, max_retries=0)
                 except Exception as e:
                     self.show_error(f"Error setting OpenAI API key: {e}")
         
@@ -1490,6 +4525,24 @@ class MainFrame(wx.Frame):
             self.language = new_language
             os.environ["TRANSCRIPTION_LANGUAGE"] = self.language
         
+        # Update transcription engine
+        backend = LocalWhisperBackend.name if self.engine_combo.GetSelection() == 1 else OpenAIWhisperBackend.name
+        if backend == LocalWhisperBackend.name and not TRANSFORMERS_AVAILABLE:
+            self.show_error("Local transcription requires transformers. Install with: pip install transformers")
+        elif backend != self.config_manager.get_transcription_backend():
+            self.config_manager.set_transcription_backend(backend)
+            self.audio_processor.set_backend(backend)
+        
+        # Update two-speaker fast mode
+        if self.two_speaker_check.GetValue() != self.config_manager.get_two_speaker_fast_mode():
+            self.config_manager.set_two_speaker_fast_mode(self.two_speaker_check.GetValue())
+        
+        # Update diarization runtime
+        if self.onnx_check.GetValue() and not ONNXRUNTIME_AVAILABLE:
+            self.show_error("ONNX Runtime is not installed. Install with: pip install onnxruntime")
+        elif self.onnx_check.GetValue() != self.config_manager.get_diarization_onnx():
+            self.config_manager.set_diarization_onnx(self.onnx_check.GetValue())
+        
         self.status_bar.SetStatusText("Settings saved successfully")
 
     def _identify_speakers_chunked(self, paragraphs, chunk_size):
@@ -1584,7 +4637,8 @@ class MainFrame(wx.Frame):
                 """
             
             # Make API call for this chunk
-            response = self.client.chat.completions.create(
+            response = openai_scheduler.call(
+                self.client.chat.completions.create,
                 model=model_to_use,
                 messages=[
                     {"role": "system", "content": "You are an expert conversation analyst who identifies speaker turns in transcripts with high accuracy."},
@@ -1694,7 +4748,8 @@ class MainFrame(wx.Frame):
         try:
             # Single API call to assign speakers
             self.update_status("Sending transcript for speaker analysis...", percent=0.3)
-            response = self.client.chat.completions.create(
+            response = openai_scheduler.call(
+                self.client.chat.completions.create,
                 model=model_to_use,
                 messages=[
                     {"role": "system", "content": "You are an expert conversation analyst who identifies speaker turns in transcripts with high accuracy."},
@@ -1881,6 +4936,14 @@ class MainFrame(wx.Frame):
         self.transcribe_btn.Disable()  # Start disabled
         transcribe_sizer.Add(self.transcribe_btn, 0, wx.EXPAND | wx.ALL, 5)
         
+        # Live microphone transcription
+        self.live_btn = wx.Button(panel, label="Start Live Transcription")
+        self.live_btn.Bind(wx.EVT_BUTTON, self.on_toggle_live)
+        if not PYAUDIO_AVAILABLE or not NUMPY_AVAILABLE:
+            self.live_btn.Disable()
+            self.live_btn.SetToolTip("Live transcription requires PyAudio and NumPy")
+        transcribe_sizer.Add(self.live_btn, 0, wx.EXPAND | wx.ALL, 5)
+        
         sizer.Add(transcribe_sizer, 0, wx.EXPAND | wx.ALL, 5)
         
         # Speaker identification
@@ -1971,6 +5034,11 @@ class MainFrame(wx.Frame):
         
     def on_close(self, event):
         """Handle application close event."""
+        if self.live_transcriber:
+            try:
+                self.live_transcriber.stop()
+            except Exception as e:
+                print(f"Error stopping live transcription: {e}")
         self.Destroy()
         
     def update_status(self, message, percent=None):
@@ -1984,7 +5052,33 @@ class MainFrame(wx.Frame):
         """Handle speaker identification button click."""
         if hasattr(self, 'transcript') and self.transcript:
             has_token = bool(self.config_manager.get_pyannote_token())
-            if has_token and hasattr(self, 'last_audio_path') and self.last_audio_path:
+            last_diarization = getattr(self, 'last_diarization', None)
+            if has_token and last_diarization and last_diarization.get("chunked") and last_diarization["audio_path"] == getattr(self, 'last_audio_path', None):
+                wx.MessageBox(
+                    "This recording is 5 minutes or longer and was diarized in chunks, so its speakers "
+                    "can't be re-clustered with a different speaker count. The existing result is used.",
+                    "Re-cluster Speakers", wx.OK | wx.ICON_INFORMATION
+                )
+                threading.Thread(
+                    target=self.identify_speakers_with_diarization,
+                    args=(self.last_audio_path, self.transcript),
+                    daemon=True
+                ).start()
+            elif has_token and last_diarization and last_diarization["audio_path"] == getattr(self, 'last_audio_path', None):
+                # The models already ran on this recording, so only the clustering step has to be redone
+                num_speakers = wx.GetNumberFromUser(
+                    "Speakers were already identified for this recording.\n"
+                    "Enter the expected number of speakers (0 = detect automatically):",
+                    "Speakers:", "Re-cluster Speakers", 0, 0, 20, self
+                )
+                if num_speakers < 0:
+                    return
+                threading.Thread(
+                    target=self.recluster_speakers,
+                    args=(self.last_audio_path, self.transcript, num_speakers or None),
+                    daemon=True
+                ).start()
+            elif has_token and hasattr(self, 'last_audio_path') and self.last_audio_path:
                 # Use advanced speaker identification with diarization
                 threading.Thread(
                     target=self.identify_speakers_with_diarization,
@@ -2032,12 +5126,13 @@ class MainFrame(wx.Frame):
                 )
                 return
                 
-            # Check file size
+            # Check file size - larger files are split into chunks, which needs FFmpeg
             file_size_mb = os.path.getsize(path) / (1024 * 1024)
-            if file_size_mb > 25:
+            if file_size_mb > WHISPER_MAX_UPLOAD_MB and not self._is_ffmpeg_available():
                 wx.MessageBox(
-                    f"The selected file is {file_size_mb:.1f}MB, which exceeds the 25MB limit for OpenAI's Whisper API.\n"
-                    f"Please choose a smaller file or compress this one.",
+                    f"The selected file is {file_size_mb:.1f}MB, which exceeds the {WHISPER_MAX_UPLOAD_MB}MB limit for OpenAI's Whisper API.\n"
+                    f"FFmpeg is required to split it into smaller chunks.\n\n"
+                    f"{self.audio_processor._get_ffmpeg_install_instructions()}",
                     "File Too Large",
                     wx.OK | wx.ICON_WARNING
                 )
@@ -2054,7 +5149,7 @@ class MainFrame(wx.Frame):
             return
             
         # Check if API key is set
-        if not self.config_manager.get_api_key():
+        if self.audio_processor.backend.name == OpenAIWhisperBackend.name and not self.config_manager.get_api_key():
             wx.MessageBox("Please set your OpenAI API key in the Settings tab.", "API Key Required", wx.OK | wx.ICON_INFORMATION)
             return
             
@@ -2089,6 +5184,12 @@ class MainFrame(wx.Frame):
             
             response = self.audio_processor.transcribe_audio(file_path, language)
             
+            # Keep what speaker identification needs; word timestamps let it skip the LLM
+            self.transcript = self.audio_processor.transcript
+            self.word_by_word = self.audio_processor.word_timeline
+            self.last_audio_path = file_path
+            self.speaker_segments = None
+            
             # Add a note about speaker identification at the top of the transcript
             transcription_notice = "--- TRANSCRIPTION COMPLETE ---\n" + \
                                   "To identify speakers in this transcript, click the 'Identify Speakers' button below.\n\n"
@@ -2123,7 +5224,7 @@ class MainFrame(wx.Frame):
                 
             wx.CallAfter(wx.MessageBox, error_msg, title, wx.OK | wx.ICON_ERROR)
         except openai.RateLimitError:
-            wx.CallAfter(wx.MessageBox, "OpenAI rate limit exceeded. Please try again later.", "Rate Limit Error", wx.OK | wx.ICON_ERROR)
+            wx.CallAfter(wx.MessageBox, "OpenAI rate limit still exceeded after several retries. Please try again later.", "Rate Limit Error", wx.OK | wx.ICON_ERROR)
         except openai.AuthenticationError:
             wx.CallAfter(wx.MessageBox, "Authentication error. Please check your OpenAI API key in the Settings tab.", "Authentication Error", wx.OK | wx.ICON_ERROR)
         except openai.BadRequestError as e:
@@ -2154,6 +5255,127 @@ class MainFrame(wx.Frame):
             wx.CallAfter(self.transcribe_btn.Enable)
             wx.CallAfter(self.update_status, "Ready", percent=0)
             
+    def on_toggle_live(self, event):
+        """Start or stop live transcription from the microphone."""
+        if getattr(self, 'live_transcriber', None):
+            self.live_btn.Disable()
+            self.update_status("Finishing live transcription...")
+            threading.Thread(target=self.stop_live_thread, daemon=True).start()
+            return
+        
+        if not self.config_manager.get_api_key() or not self.audio_processor.client:
+            wx.MessageBox("Please set your OpenAI API key in the Settings tab.", "API Key Required", wx.OK | wx.ICON_INFORMATION)
+            return
+        
+        lang_map = {"English": "en", "Hungarian": "hu"}
+        language = lang_map.get(self.language_choice.GetString(self.language_choice.GetSelection()), "en")
+        
+        # Keep the recording so speakers can be identified once it is finished
+        transcripts_dir = os.path.join(APP_BASE_DIR, "Transcripts") if APP_BASE_DIR else "Transcripts"
+        os.makedirs(transcripts_dir, exist_ok=True)
+        recording_path = os.path.join(transcripts_dir, f"live_{datetime.now().strftime('%Y%m%d_%H%M%S')}.wav")
+        
+        self.live_transcriber = LiveTranscriber(
+            self.audio_processor.client,
+            language=language,
+            text_callback=lambda text: wx.CallAfter(self.transcript_text.AppendText, text + " "),
+            status_callback=lambda message: wx.CallAfter(self.update_status, message),
+            recording_path=recording_path
+        )
+        
+        try:
+            self.transcript_text.SetValue("")
+            self.live_transcriber.start()
+        except Exception as e:
+            self.live_transcriber = None
+            self.show_error(f"Could not start recording: {str(e)}")
+            return
+        
+        self.live_btn.SetLabel("Stop Live Transcription")
+        self.transcribe_btn.Disable()
+        self.identify_speakers_btn.Disable()
+        self.summarize_btn.Disable()
+    
+    def stop_live_thread(self):
+        """Thread function that finishes live transcription."""
+        live = self.live_transcriber
+        try:
+            transcript = live.stop()
+            self.transcript = transcript
+            self.audio_processor.transcript = transcript
+            self.audio_processor.transcript_response = None
+            self.audio_processor.word_timeline = None
+            self.word_by_word = None
+            self.speaker_segments = None
+            self.audio_processor.audio_file_path = live.recording_path
+            self.last_audio_path = live.recording_path
+            
+            wx.CallAfter(self.audio_file_path.SetValue, live.recording_path)
+            wx.CallAfter(self.transcript_text.SetValue, transcript)
+            wx.CallAfter(self.update_status, f"Live transcription complete: {len(transcript)} characters", percent=100)
+        except Exception as e:
+            wx.CallAfter(wx.MessageBox, f"Live transcription error: {str(e)}", "Error", wx.OK | wx.ICON_ERROR)
+        finally:
+            self.live_transcriber = None
+            wx.CallAfter(self.live_btn.SetLabel, "Start Live Transcription")
+            wx.CallAfter(self.live_btn.Enable)
+            wx.CallAfter(self.update_button_states)
+    
+    def on_batch_transcribe(self, event):
+        """Transcribe every supported audio file in a folder."""
+        if self.audio_processor.backend.name == OpenAIWhisperBackend.name and not self.config_manager.get_api_key():
+            wx.MessageBox("Please set your OpenAI API key in the Settings tab.", "API Key Required", wx.OK | wx.ICON_INFORMATION)
+            return
+        
+        with wx.DirDialog(self, "Choose a folder with audio files", defaultPath=os.path.expanduser("~"),
+                          style=wx.DD_DEFAULT_STYLE | wx.DD_DIR_MUST_EXIST) as dir_dialog:
+            if dir_dialog.ShowModal() == wx.ID_CANCEL:
+                return
+            folder = dir_dialog.GetPath()
+        
+        files = BatchTranscriber.collect_audio_files(folder)
+        if not files:
+            self.show_error("No supported audio files found in the selected folder.")
+            return
+        
+        # Use the language selected on the audio panel
+        lang_map = {"English": "en", "Hungarian": "hu"}
+        language = lang_map.get(self.language_choice.GetString(self.language_choice.GetSelection()), "en")
+        
+        self.update_status(f"Batch transcribing {len(files)} files...", percent=0)
+        threading.Thread(target=self.batch_transcribe_thread, args=(files, language), daemon=True).start()
+    
+    def batch_transcribe_thread(self, files, language):
+        """Thread function for batch transcription."""
+        finished = []
+        
+        def on_progress(path, status, detail=None):
+            if status in ("done", "cached", "error"):
+                finished.append(path)
+                wx.CallAfter(self.update_status,
+                             f"Batch: {os.path.basename(path)} {status} ({len(finished)}/{len(files)})",
+                             percent=100 * len(finished) / len(files))
+        
+        try:
+            batch = BatchTranscriber(
+                self.config_manager.get_api_key(),
+                self.audio_processor,
+                language=language,
+                concurrency=self.config_manager.get_batch_concurrency(),
+                progress_callback=on_progress
+            )
+            results = batch.run(files)
+            
+            failed = [path for path, result in results.items() if isinstance(result, Exception)]
+            message = f"Transcribed {len(files) - len(failed)} of {len(files)} files.\nTranscripts were saved to {batch.output_dir}"
+            if failed:
+                message += "\n\nFailed:\n" + "\n".join(f"{os.path.basename(path)}: {results[path]}" for path in failed)
+            wx.CallAfter(wx.MessageBox, message, "Batch Transcription", wx.OK | wx.ICON_INFORMATION)
+        except Exception as e:
+            wx.CallAfter(wx.MessageBox, f"Batch transcription error: {str(e)}", "Error", wx.OK | wx.ICON_ERROR)
+        finally:
+            wx.CallAfter(self.update_status, "Ready", percent=0)
+    
     def show_speaker_id_hint(self):
         """Show a hint dialog about using speaker identification."""
         # Check if PyAnnote is available
@@ -2398,61 +5620,196 @@ Troubleshooting:
                 if len(self.speakers[i]["text"].split()) < 15:
                     self.speakers[i]["speaker"] = prev_speaker
 
-    def _process_audio_in_chunks(self, pipeline, audio_file, total_duration, chunk_size):
-        """Process long audio files in chunks to optimize memory usage and speed."""
-        from pyannote.core import Segment, Annotation
+    def _process_audio_in_chunks(self, pipeline, audio, total_duration, plan,
+                                 model="pyannote/speaker-diarization@2.1", token=None, state=None, onnx=False):
+        """
+        Diarize long audio as overlapping windows spread over a pool of worker processes.
+        
+        Every worker loads the pipeline once and runs with a few torch threads, so
+        the machine's cores are split between several windows instead of all
+        working on one. Window length, overlap and worker count come from the
+        DiarizationChunkPlanner plan, and the measured throughput is reported back
+        to it. The overlap is used to match speaker labels between neighbouring windows and
+        each window keeps the turns up to the middle of its overlaps. Speaker labels
+        are reconciled across all windows with centroid embeddings.
+        
+        Given the state of an earlier run on the start of the same recording, only
+        the audio after it (plus one overlap) is diarized and its speakers are
+        matched against the earlier speakers. With onnx, the workers run the models
+        through ONNX Runtime as well.
+        
+        Returns:
+            (annotation, state) tuple; pass the state to continue once the recording has grown
+        """
         import concurrent.futures
-        from threading import Lock
+        import multiprocessing
+        
+        chunk_size, overlap = plan["chunk_size"], plan["overlap"]
+        windows = []
+        # A continuation starts where the fingerprint of the earlier run stops being verified
+        start = max(0.0, state["until"] - state["overlap"]) if state else 0.0
+        while start < total_duration:
+            windows.append((start, min(total_duration, start + chunk_size + overlap)))
+            start += chunk_size
+        
+        workers = max(1, min(len(windows), plan["workers"]))
+        threads = plan["threads"]
+        self.update_status(
+            f"Processing audio in {len(windows)} chunks of {chunk_size / 60:.1f} min on {workers} worker(s)...", percent=0.25
+        )
         
-        # Initialize a combined annotation object
-        combined_diarization = Annotation()
+        started = time.perf_counter()
+        results = [None] * len(windows)
+        if workers == 1 or not token:
+            # Not worth starting processes; use the pipeline that is already loaded
+            for i, (start, end) in enumerate(windows):
+                results[i] = _diarize_window(audio, start, end, pipeline, token)
+                self.update_status(f"Diarized chunk {i + 1}/{len(windows)}...", percent=0.25 + 0.5 * (i + 1) / len(windows))
+        else:
+            # Spawned workers don't inherit torch or wx state from this process
+            with concurrent.futures.ProcessPoolExecutor(
+                max_workers=workers,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_diarization_worker_init,
+                initargs=(model, token, threads, diarization_pipelines.cpu_mode, onnx, APP_BASE_DIR)
+            ) as executor:
+                futures = {
+                    executor.submit(_diarize_window, audio, start, end): i
+                    for i, (start, end) in enumerate(windows)
+                }
+                for completed, future in enumerate(concurrent.futures.as_completed(futures), 1):
+                    results[futures[future]] = future.result()
+                    self.update_status(f"Diarized chunk {completed}/{len(windows)}...", percent=0.25 + 0.5 * completed / len(windows))
+        
+        # Later plans on this machine use what this run achieved
+        self.chunk_planner.record(
+            model,
+            sum(end - start for start, end in windows),
+            time.perf_counter() - started,
+            torch.get_num_threads() if workers == 1 or not token else workers * threads,
+            onnx
+        )
         
-        # Calculate number of chunks
-        num_chunks = int(np.ceil(total_duration / chunk_size))
-        self.update_status(f"Processing audio in {num_chunks} chunks...", percent=0.1)
+        self.update_status("Reconciling speakers across chunks...", percent=0.75)
+        annotation, state = self._merge_chunk_diarizations(windows, results, state)
+        if windows:
+            state["overlap"] = overlap
+        return annotation, state
+    
+    def _merge_chunk_diarizations(self, windows, results, state=None):
+        """
+        Merge per-window diarization turns into one Annotation with one global speaker set.
         
-        # Optimize number of workers based on file length and available memory
-        # More chunks = more workers (up to cpu_count), but limit for very long files
-        # to avoid excessive memory usage
-        cpu_count = os.cpu_count() or 4
+        Each window's speakers are matched to the global speakers found so far by cosine
+        similarity of their centroid embeddings (one-to-one within a window, so two voices
+        in the same window never merge). Speakers without an embedding fall back to how
+        long they co-talk with global speakers in the overlap with the previous window.
+        Unmatched speakers become new global speakers. Each window contributes its turns
+        between the midpoints of its overlaps.
         
-        try:
-            # Create hash of file path and modification time to use as cache key
-            file_stats = os.stat(audio_file_path)
-            file_hash = hashlib.md5(f"{audio_file_path}_{file_stats.st_mtime}".encode()).hexdigest()
-            
-            # Use APP_BASE_DIR if available
-            if APP_BASE_DIR:
-                cache_dir = os.path.join(APP_BASE_DIR, "diarization_cache")
+        Args:
+            windows: List of (start, end) windows in playback order
+            results: List of (turns, centroids) tuples from _diarize_window
+            state: Optional state of an earlier merge that the windows continue
+        
+        Returns:
+            (annotation, state) tuple, where state holds the merged turns, the global
+            speakers' centroid sums and the time the merge covers
+        """
+        from scipy.optimize import linear_sum_assignment
+        
+        combined_diarization = Annotation()
+        global_sums = list(state["sums"]) if state else []  # Running sum of member centroids per global speaker (None without embeddings)
+        previous_turns = list(state["turns"]) if state else []
+        
+        if state:
+            # The earlier result acts as one more window, kept only up to the fingerprinted audio
+            keep_end = windows[0][0] if windows else state["until"]
+            for start, end, global_index in state["turns"]:
+                if min(end, keep_end) > start:
+                    segment = Segment(start, min(end, keep_end))
+                    combined_diarization[segment, combined_diarization.new_track(segment)] = f"SPEAKER_{global_index:02d}"
+        
+        for i, ((window_start, window_end), (turns, centroids)) in enumerate(zip(windows, results)):
+            local_labels = sorted(set(label for _, _, label in turns))
+            mapping = {}
+            
+            # 1. Match by voice: Hungarian assignment on centroid similarity
+            with_embedding = [label for label in local_labels if label in centroids]
+            known = [index for index, total in enumerate(global_sums) if total is not None]
+            if with_embedding and known:
+                global_centroids = np.stack([global_sums[index] / np.linalg.norm(global_sums[index]) for index in known])
+                similarity = np.stack([centroids[label] for label in with_embedding]) @ global_centroids.T
+                for row, column in zip(*linear_sum_assignment(-similarity)):
+                    if similarity[row, column] >= DIARIZATION_SPEAKER_SIMILARITY:
+                        mapping[with_embedding[row]] = known[column]
+            
+            # 2. Match speakers without embeddings by co-talk time in the overlap with the previous window
+            if i > 0:
+                overlap_end = windows[i - 1][1]
             else:
-                cache_dir = "diarization_cache"
-                
-            if not os.path.exists(cache_dir):
-                os.makedirs(cache_dir)
-                
-            # Cache file path
-            cache_file = os.path.join(cache_dir, f"{file_hash}.diar")
-            
-            # Save results
-            self.update_status("Saving diarization results to cache for future use...", percent=0.95)
-            with open(cache_file, 'wb') as f:
-                pickle.dump(self.diarization, f)
-            
-            # Clean up old cache files if there are more than 20
-            cache_files = [os.path.join(cache_dir, f) for f in os.listdir(cache_dir) if f.endswith('.diar')]
-            if len(cache_files) > 20:
-                # Sort by modification time and remove oldest
-                cache_files.sort(key=os.path.getmtime)
-                for old_file in cache_files[:-20]:  # Keep the 20 most recent
-                    os.unlink(old_file)
-                    
-            self.update_status("Successfully cached results for future use", percent=0.98)
-        except Exception as e:
-            self.update_status(f"Error saving to cache: {str(e)}", percent=0.95)
-            # Continue without caching - non-critical error
+                overlap_end = state["until"] if state else window_start
+            co_talk = {}
+            for start, end, local in turns:
+                # A voice that didn't match any known voice is a new speaker
+                if local in mapping or (local in centroids and known):
+                    continue
+                for prev_start, prev_end, global_index in previous_turns:
+                    shared = min(end, prev_end, overlap_end) - max(start, prev_start, window_start)
+                    if shared > 0:
+                        co_talk[(local, global_index)] = co_talk.get((local, global_index), 0.0) + shared
+            for (local, global_index), _ in sorted(co_talk.items(), key=lambda item: -item[1]):
+                if local not in mapping and global_index not in mapping.values():
+                    mapping[local] = global_index
+            
+            # 3. Everyone else is a new speaker
+            for local in local_labels:
+                if local not in mapping:
+                    mapping[local] = len(global_sums)
+                    global_sums.append(None)
+                if local in centroids:
+                    current = global_sums[mapping[local]]
+                    global_sums[mapping[local]] = centroids[local] if current is None else current + centroids[local]
+            
+            # Keep turns between the middle of the overlap with the previous and next windows
+            keep_start = (window_start + overlap_end) / 2 if i > 0 else window_start
+            keep_end = (windows[i + 1][0] + window_end) / 2 if i + 1 < len(windows) else window_end
+            
+            previous_turns = []
+            for start, end, local in turns:
+                previous_turns.append((start, end, mapping[local]))
+                clipped_start, clipped_end = max(start, keep_start), min(end, keep_end)
+                if clipped_end > clipped_start:
+                    segment = Segment(clipped_start, clipped_end)
+                    combined_diarization[segment, combined_diarization.new_track(segment)] = f"SPEAKER_{mapping[local]:02d}"
+        
+        combined_diarization = combined_diarization.support()
+        state = {
+            "turns": [
+                (segment.start, segment.end, int(label.split("_")[-1]))
+                for segment, _, label in combined_diarization.itertracks(yield_label=True)
+            ],
+            "sums": global_sums,
+            "until": windows[-1][1] if windows else state["until"]
+        }
+        return combined_diarization, state
     
-    def identify_speakers_with_diarization(self, audio_file_path, transcript):
-        """Identify speakers using audio diarization with PyAnnote."""
+    def identify_speakers_with_diarization(self, audio_file_path, transcript, num_speakers=None, two_speaker_fast=None,
+                                           onnx=None, clustering_threshold=None):
+        """
+        Identify speakers using audio diarization with PyAnnote.
+        
+        Args:
+            num_speakers: Known number of speakers, or None to let the pipeline decide
+            two_speaker_fast: Use the segmentation-only two-speaker mode; None picks it when
+                num_speakers is 2 or it is enabled in the settings
+            onnx: Run the models through ONNX Runtime instead of torch; None uses the setting
+            clustering_threshold: Optional clustering threshold overriding the pipeline's
+        
+        num_speakers and clustering_threshold apply to recordings under 5 minutes. Longer
+        recordings are diarized in chunks whose speakers are matched by embedding
+        similarity, so they can't be re-clustered afterwards either.
+        """
         self.update_status("Performing audio diarization analysis...", percent=0.05)
         
         # Check if PyAnnote is available
@@ -2460,24 +5817,82 @@ Troubleshooting:
             self.update_status("PyAnnote not available. Install with: pip install pyannote.audio", percent=0)
             return self.identify_speakers_simple(transcript)
         
-        # Check if we have cached results - if so, skip to mapping
-        if self._check_diarization_cache(audio_file_path):
-            self.update_status("Using cached diarization results...", percent=0.4)
+        try:
+            model = "pyannote/speaker-diarization@2.1"
             
-            # Get audio information for status reporting
-            audio_duration = librosa.get_duration(path=audio_file_path)
-            is_short_file = audio_duration < 300
+            # Decode once; the duration, the chunking and the pipeline all read the same samples
+            self.update_status("Decoding audio...", percent=0.07)
+            audio = DecodedAudio.load(audio_file_path)
+            audio_duration = audio.duration
+            self.update_status(f"Audio duration: {audio_duration:.1f} seconds", percent=0.1)
             
-            # Skip to mapping step
-            if is_short_file:
-                self.update_status("Fast mapping diarization to transcript...", percent=0.8)
-                return self._fast_map_diarization(transcript)
+            # Very short files need very different processing approach
+            is_short_file = audio_duration < 300  # Less than 5 minutes
+            
+            if two_speaker_fast is None:
+                two_speaker_fast = num_speakers == 2 or bool(
+                    self.config_manager and self.config_manager.get_two_speaker_fast_mode()
+                )
+            
+            if onnx is None:
+                onnx = diarization_pipelines.onnx
+            if onnx and not ONNXRUNTIME_AVAILABLE:
+                print("ONNX Runtime not available, diarizing with torch. Install with: pip install onnxruntime")
+                onnx = False
+            inference = diarization_pipelines.inference_mode(onnx=onnx)
+            
+            if two_speaker_fast:
+                # Two-party calls are tracked from segmentation alone; no embeddings to re-cluster later
+                cache_params = {"mode": "two-speaker", "min_duration_off": DIARIZATION_TWO_SPEAKER_MIN_OFF}
+                self.last_diarization = None
+            elif is_short_file:
+                # Ultra-optimized parameters for short files (5 min or less)
+                hyperparameters = {
+                    # More aggressive voice activity detection for speed
+                    "segmentation": {
+                        "min_duration_off": 0.25,     # Shorter minimum silence
+                    },
+                    # Faster clustering with fewer speakers expected in short clips
+                    "clustering": {
+                        "min_cluster_size": 6,        # Require fewer samples (default 15)
+                        "method": "centroid"          # Faster than "average" linkage
+                    }
+                }
+                if clustering_threshold is not None:
+                    hyperparameters["clustering"]["threshold"] = clustering_threshold
+                cache_params = {
+                    "mode": "short", "hyperparameters": hyperparameters,
+                    "short_clip_max_speakers": 3, "num_speakers": num_speakers
+                }
+                self.last_diarization = {
+                    "audio_path": audio_file_path, "model": model, "params": hyperparameters, "cache_params": cache_params
+                }
             else:
+                # Chunk length and workers are planned per machine, so they are not part of the key
+                cache_params = {
+                    "mode": "chunked",
+                    "embedding": DIARIZATION_EMBEDDING_MODEL,
+                    "similarity": DIARIZATION_SPEAKER_SIMILARITY
+                }
+                # Chunk speakers are merged by similarity, with no features to re-cluster
+                self.last_diarization = {
+                    "audio_path": audio_file_path, "model": model, "params": None, "cache_params": cache_params, "chunked": True
+                }
+            # Results of the quantized, float and ONNX models are cached separately
+            cache_params["inference"] = inference
+            
+            # Check if we have cached results - if so, skip to mapping
+            diarization_cache = self.audio_processor.diarization_cache
+            cache_key = diarization_cache.make_key(audio_file_path, model, cache_params)
+            cached = diarization_cache.get(cache_key)
+            if cached is not None:
+                self.update_status("Using cached diarization results...", percent=0.4)
+                self.diarization = cached
+                if is_short_file:
+                    self.update_status("Fast mapping diarization to transcript...", percent=0.8)
+                    return self._fast_map_diarization(transcript)
                 return self._map_diarization_to_transcript(transcript)
-        
-        # No cache, proceed with normal processing
-        # Step 1: Initialize PyAnnote pipeline
-        try:
+            
             # Get token from config_manager if available
             token = None
             if self.config_manager:
@@ -2502,98 +5917,92 @@ Troubleshooting:
                 self.update_status("PyAnnote token not found in settings. Please add your token in the Settings tab.", percent=0)
                 return self.identify_speakers_simple(transcript)
             
-            self.update_status("Initializing diarization pipeline...", percent=0.1)
-            
-            # Initialize the PyAnnote pipeline
-            pipeline = pyannote.audio.Pipeline.from_pretrained(
-                "pyannote/speaker-diarization@2.1",
-                use_auth_token=token
-            )
-            
-            # Set device (GPU if available)
-            device = "cuda" if torch.cuda.is_available() else "cpu"
-            pipeline = pipeline.to(torch.device(device))
-            
-            # Convert the file to WAV format if needed
-            if not audio_file_path.lower().endswith('.wav'):
-                self.update_status("Converting audio to WAV format for diarization...", percent=0.15)
-                converted_file = self.convert_to_wav(audio_file_path)
-                diarization_file = converted_file
-            else:
-                diarization_file = audio_file_path
-            
-            # Get audio file information
-            audio_duration = librosa.get_duration(path=diarization_file)
-            self.update_status(f"Audio duration: {audio_duration:.1f} seconds", percent=0.2)
-            
-            # Very short files need very different processing approach
-            is_short_file = audio_duration < 300  # Less than 5 minutes
-            
-            if is_short_file:
-                # Ultra fast mode for short files (5 min or less) - direct processing with optimized parameters
+            if onnx and not os.path.exists(os.path.join(_onnx_model_dir(model), "export.json")):
+                self.update_status("Exporting diarization models to ONNX (first use only)...", percent=0.15)
+                try:
+                    if not export_diarization_onnx(model, token):
+                        raise ValueError("no model passed the export check")
+                except Exception as e:
+                    print(f"WARNING: Error exporting diarization models to ONNX, using torch: {e}")
+                    onnx = False
+                    # The torch results belong under the torch key
+                    cache_params["inference"] = diarization_pipelines.inference_mode(onnx=False)
+                    cache_key = diarization_cache.make_key(audio_file_path, model, cache_params)
+            
+            self.update_status("Initializing diarization pipeline...", percent=0.2)
+            started = time.perf_counter()
+            
+            if two_speaker_fast:
+                self.update_status("Two-speaker fast mode: tracking both speakers from segmentation only...", percent=0.25)
+                with diarization_pipelines.acquire(model, token, onnx=onnx) as pipeline:
+                    self.diarization = _diarize_two_speakers(pipeline, audio)
+            elif is_short_file:
                 self.update_status("Short audio detected, using ultra-fast mode...", percent=0.25)
                 
-                # Use ultra-optimized parameters for short files
-                pipeline.instantiate({
-                    # More aggressive voice activity detection for speed
-                    "segmentation": {
-                        "min_duration_on": 0.25,      # Shorter minimum speech (default 0.1s)
-                        "min_duration_off": 0.25,     # Shorter minimum silence (default 0.1s)
-                    },
-                    # Faster clustering with fewer speakers expected in short clips
-                    "clustering": {
-                        "min_cluster_size": 6,        # Require fewer samples (default 15)
-                        "method": "centroid"          # Faster than "average" linkage
-                    },
-                    # Skip post-processing for speed
-                    "segmentation_batch_size": 32,    # Larger batch for speed
-                    "embedding_batch_size": 32,       # Larger batch for speed
-                })
-                
-                # Apply diarization directly for short files
-                self.update_status("Processing audio (fast mode)...", percent=0.3)
-                self.diarization = pipeline(diarization_file)
-                
-                # For very short files, optimize the diarization results
-                if audio_duration < 60:  # Less than 1 minute
-                    # Further optimize by limiting max speakers for very short clips
-                    num_speakers = len(set(s for _, _, s in self.diarization.itertracks(yield_label=True)))
-                    if num_speakers > 3:
-                        self.update_status("Optimizing speaker count for short clip...", percent=0.7)
-                        # Re-run with max_speakers=3 for very short clips
-                        self.diarization = pipeline(diarization_file, num_speakers=3)
+                # Borrow the loaded pipeline with this job's parameters and larger batches for speed
+                with diarization_pipelines.acquire(
+                    model, token,
+                    params=hyperparameters,
+                    attributes={"segmentation_batch_size": 32, "embedding_batch_size": 32},
+                    onnx=onnx
+                ) as pipeline:
+                    # Apply diarization directly for short files, keeping the embeddings for re-clustering
+                    self.update_status("Processing audio (fast mode)...", percent=0.3)
+                    speaker_kwargs = {"num_speakers": num_speakers} if num_speakers else {}
+                    self.diarization, features = _run_diarization(pipeline, audio, **speaker_kwargs)
+                    if features is not None:
+                        diarization_cache.put_features(diarization_cache.make_key(audio_file_path, model, dict(cache_params, features=True)), features)
+                    
+                    # For very short files, optimize the diarization results
+                    if audio_duration < 60 and features is not None and not num_speakers:  # Less than 1 minute
+                        # Further optimize by limiting max speakers for very short clips
+                        if len(self.diarization.labels()) > 3:
+                            self.update_status("Optimizing speaker count for short clip...", percent=0.7)
+                            # Re-cluster the same embeddings into at most 3 speakers instead of re-running the models
+                            self.diarization = _recluster_diarization(pipeline, features, max_speakers=3)
             else:
-                # Determine chunk size based on audio duration - longer files use chunking
-                if audio_duration > 10800:  # > 3 hours
-                    # For extremely long recordings, use very small 3-minute chunks
-                    MAX_CHUNK_DURATION = 180  # 3 minutes per chunk
-                    self.update_status("Extremely long audio detected (>3 hours). Using highly optimized micro-chunks.", percent=0.22)
-                elif audio_duration > 5400:  # > 1.5 hours
-                    # For very long recordings, use 4-minute chunks
-                    MAX_CHUNK_DURATION = 240  # 4 minutes per chunk
-                    self.update_status("Very long audio detected (>1.5 hours). Using micro-chunks for improved performance.", percent=0.22)
-                elif audio_duration > 3600:  # > 1 hour
-                    # For long recordings, use 5-minute chunks
-                    MAX_CHUNK_DURATION = 300  # 5 minutes per chunk
-                    self.update_status("Long audio detected (>1 hour). Using optimized chunk size.", percent=0.22)
-                elif audio_duration > 1800:  # > 30 minutes
-                    # For medium recordings, use 7.5-minute chunks
-                    MAX_CHUNK_DURATION = 450  # 7.5 minutes per chunk
-                    self.update_status("Medium-length audio detected (>30 minutes). Using optimized chunk size.", percent=0.22)
+                # A recording that only grew since its last run continues where that run stopped
+                session_key = diarization_cache.make_session_key(audio_file_path, model, cache_params)
+                state = diarization_cache.get_state(session_key)
+                if state is not None and (
+                    state["until"] >= audio_duration
+                    or audio.fingerprint(state["until"] - state["overlap"]) != state["fingerprint"]
+                ):
+                    state = None
+                
+                if state:
+                    new_minutes = (audio_duration - state["until"]) / 60
+                    self.update_status(f"Recording has grown; diarizing only the {new_minutes:.1f} new minutes...", percent=0.25)
                 else:
-                    # Default 10-minute chunks for shorter files
-                    MAX_CHUNK_DURATION = 600  # 10 minutes per chunk
+                    # Process in chunks for longer files
+                    self.update_status("Processing in chunks for optimized performance...", percent=0.25)
+                with diarization_pipelines.acquire(model, token, onnx=onnx) as pipeline:
+                    def calibrate():
+                        # Diarize the first minute to learn how fast this machine is
+                        self.update_status("Measuring diarization speed on this machine...", percent=0.22)
+                        sample_end = min(audio_duration, DIARIZATION_CALIBRATION_SECONDS)
+                        calibration_started = time.perf_counter()
+                        pipeline(audio.speech_input(0.0, sample_end)[0])
+                        return sample_end, time.perf_counter() - calibration_started, torch.get_num_threads()
+                    
+                    remaining = audio_duration - (state["until"] if state else 0.0)
+                    plan = self.chunk_planner.plan(remaining, model, calibrate=calibrate, onnx=onnx)
+                    self.diarization, state = self._process_audio_in_chunks(
+                        pipeline, audio, audio_duration, plan,
+                        model=model, token=token, state=state, onnx=onnx
+                    )
                 
-                # Process in chunks for longer files
-                self.update_status("Processing in chunks for optimized performance...", percent=0.25)
-                self.diarization = self._process_audio_in_chunks(pipeline, diarization_file, audio_duration, MAX_CHUNK_DURATION)
+                state["fingerprint"] = audio.fingerprint(state["until"] - state["overlap"])
+                diarization_cache.put_state(session_key, state)
             
-            # Clean up converted file if needed
-            if diarization_file != audio_file_path and os.path.exists(diarization_file):
-                os.unlink(diarization_file)
+            # Real-time factor: processing seconds per second of audio, lower is faster
+            elapsed = time.perf_counter() - started
+            real_time_factor = elapsed / audio_duration if audio_duration else 0.0
+            print(f"Diarized {audio_duration:.0f}s of audio in {elapsed:.1f}s (real-time factor {real_time_factor:.3f})")
+            self.update_status(f"Diarization finished in {elapsed:.0f}s (real-time factor {real_time_factor:.2f})", percent=0.78)
             
             # Save diarization results to cache for future use
-            self._save_diarization_cache(audio_file_path)
+            diarization_cache.put(cache_key, self.diarization)
             
             # Now we have diarization data, map it to the transcript using word timestamps
             # Use optimized mapping for short files
@@ -2609,313 +6018,92 @@ Troubleshooting:
             return self.identify_speakers_simple(transcript)
 
     def _fast_map_diarization(self, transcript):
-        """Simplified and faster mapping for short files."""
+        """Map diarization to the transcript for short files, using every speaker turn."""
         self.update_status("Fast mapping diarization results to transcript...", percent=0.85)
+        return self._map_diarization_to_transcript(transcript, min_turn=0.0)
+    
+    def recluster_speakers(self, audio_file_path, transcript, num_speakers=None, clustering_threshold=None):
+        """
+        Re-cluster the speakers of an already diarized recording with a new speaker count or threshold.
         
-        if not hasattr(self, 'word_by_word') or not self.word_by_word or not self.diarization:
-            return self.identify_speakers_simple(transcript)
+        Only the clustering step runs, on the segmentation scores and embeddings cached by the
+        previous diarization; falls back to a full diarization when they aren't cached.
+        Recordings diarized in chunks (5 minutes or longer) have no such features.
+        
+        Args:
+            audio_file_path: Recording that was diarized before
+            transcript: Transcript to map the new speaker turns onto
+            num_speakers: Expected number of speakers, or None to detect automatically
+            clustering_threshold: Optional clustering threshold overriding the pipeline's
+        """
+        last_diarization = getattr(self, 'last_diarization', None)
+        features = None
+        if last_diarization and last_diarization["audio_path"] == audio_file_path:
+            diarization_cache = self.audio_processor.diarization_cache
+            model = last_diarization["model"]
+            features = diarization_cache.get_features(
+                diarization_cache.make_key(audio_file_path, model, dict(last_diarization["cache_params"], features=True))
+            )
+        
+        if features is None:
+            return self.identify_speakers_with_diarization(
+                audio_file_path, transcript, num_speakers=num_speakers, clustering_threshold=clustering_threshold
+            )
         
         try:
-            # Create speaker timeline map at higher granularity (every 0.2s)
-            timeline_map = {}
-            speaker_set = set()
-            
-            # Extract all speakers and their time ranges
-            for segment, _, speaker in self.diarization.itertracks(yield_label=True):
-                start_time = segment.start
-                end_time = segment.end
-                speaker_set.add(speaker)
-                
-                # For short files, we can afford fine-grained sampling
-                step = 0.1  # 100ms steps
-                for t in np.arange(start_time, end_time, step):
-                    timeline_map[round(t, 1)] = speaker
-            
-            # Create paragraphs if they don't exist
-            if hasattr(self, 'speaker_segments') and self.speaker_segments:
-                paragraphs = self.speaker_segments
-            else:
-                paragraphs = self._create_improved_paragraphs(transcript)
-                self.speaker_segments = paragraphs
-            
-            # Calculate overall speakers - short clips typically have 1-3 speakers
-            num_speakers = len(speaker_set)
-            self.update_status(f"Detected {num_speakers} speakers in audio", percent=0.9)
-            
-            # Map each word to a speaker
-            word_speakers = {}
-            for word_info in self.word_by_word:
-                if not hasattr(word_info, "start") or not hasattr(word_info, "end"):
-                    continue
-                
-                # Take the middle point of each word
-                word_time = round((word_info.start + word_info.end) / 2, 1)
-                
-                # Find closest time in our map
-                closest_time = min(timeline_map.keys(), key=lambda x: abs(x - word_time), default=None)
-                if closest_time is not None and abs(closest_time - word_time) < 1.0:
-                    word_speakers[word_info.word] = timeline_map[closest_time]
+            self.update_status("Re-clustering speakers...", percent=0.5)
+            params = json.loads(json.dumps(last_diarization["params"] or {}))
+            if clustering_threshold is not None:
+                params.setdefault("clustering", {})["threshold"] = clustering_threshold
             
-            # Now assign speakers to paragraphs based on word majority
-            self.speakers = []
-            for paragraph in paragraphs:
-                para_speakers = []
-                
-                # Count speakers in this paragraph
-                words = re.findall(r'\b\w+\b', paragraph.lower())
-                for word in words:
-                    if word in word_speakers:
-                        para_speakers.append(word_speakers[word])
-                
-                # Find most common speaker
-                if para_speakers:
-                    from collections import Counter
-                    speaker_counts = Counter(para_speakers)
-                    most_common_speaker = speaker_counts.most_common(1)[0][0]
-                    speaker_id = f"Speaker {most_common_speaker.split('_')[-1]}"
-                else:
-                    # Fallback for paragraphs with no identified speaker
-                    speaker_id = f"Speaker 1"
-                
-                self.speakers.append({
-                    "speaker": speaker_id,
-                    "text": paragraph
-                })
-            
-            # Final quick consistency check for short files
-            if len(self.speakers) > 1:
-                self._quick_consistency_check()
-            
-            self.update_status(f"Diarization complete. Found {num_speakers} speakers.", percent=1.0)
-            return self.speakers
+            token = self.config_manager.get_pyannote_token() if self.config_manager else None
+            with diarization_pipelines.acquire(model, token, params=params or None) as pipeline:
+                self.diarization = _recluster_diarization(pipeline, features, num_speakers=num_speakers)
             
+            return self._map_diarization_to_transcript(transcript)
         except Exception as e:
-            self.update_status(f"Error in fast mapping: {str(e)}", percent=0)
-            return self.identify_speakers_simple(transcript)
+            self.update_status(f"Error re-clustering speakers: {str(e)}", percent=0)
+            return self.identify_speakers_with_diarization(
+                audio_file_path, transcript, num_speakers=num_speakers, clustering_threshold=clustering_threshold
+            )
     
-    def _map_diarization_to_transcript(self, transcript):
-        """Memory-efficient mapping for long files by using sparse sampling and batch processing."""
-        self.update_status("Mapping diarization results to transcript (optimized for long files)...", percent=0.8)
+    def _map_diarization_to_transcript(self, transcript, min_turn=0.5):
+        """
+        Map diarization turns to the transcript using Whisper's word timestamps.
+        
+        Each word gets the speaker talking at its midpoint and consecutive words of
+        the same speaker become one paragraph, so no LLM call is needed.
+        """
+        self.update_status("Mapping diarization results to transcript...", percent=0.8)
         
-        if not hasattr(self, 'word_by_word') or not self.word_by_word or not self.diarization:
+        timeline = getattr(self, 'word_by_word', None)
+        if not timeline or not getattr(self, 'diarization', None):
             return self.identify_speakers_simple(transcript)
-            
+        
         try:
-            # Get initial speaker count for progress reporting
-            speaker_set = set()
-            segment_count = 0
-            
-            # Quick scan to count speakers and segments - don't store details yet
-            for segment, _, speaker in self.diarization.itertracks(yield_label=True):
-                speaker_set.add(speaker)
-                segment_count += 1
-                
-            num_speakers = len(speaker_set)
-            self.update_status(f"Detected {num_speakers} speakers across {segment_count} segments", percent=0.82)
-            
-            # Create paragraphs if they don't exist
-            if hasattr(self, 'speaker_segments') and self.speaker_segments:
-                paragraphs = self.speaker_segments
-            else:
-                paragraphs = self._create_improved_paragraphs(transcript)
-                self.speaker_segments = paragraphs
-                
-            # OPTIMIZATION 1: For long files, use sparse sampling of the timeline
-            # Instead of creating a dense timeline map which is memory-intensive,
-            # we'll create a sparse map with only the segment boundaries
-            timeline_segments = []
+            # Very short turns are mostly overlap and noise in long recordings
+            turns = [
+                (segment.start, segment.end, speaker)
+                for segment, _, speaker in self.diarization.itertracks(yield_label=True)
+                if segment.duration >= min_turn
+            ]
+            if not turns:
+                return self.identify_speakers_simple(transcript)
             
-            # Use diarization_cache directory for temporary storage if needed
-            if APP_BASE_DIR:
-                cache_dir = os.path.join(APP_BASE_DIR, "diarization_cache")
-            else:
-                cache_dir = "diarization_cache"
-                
-            if not os.path.exists(cache_dir):
-                os.makedirs(cache_dir)
-                
-            # OPTIMIZATION 2: For very long files, process diarization in chunks to avoid memory issues
-            chunk_size = 1000  # Process 1000 segments at a time
-            use_temp_storage = segment_count > 5000  # Only use temp storage for very large files
-            
-            # If using temp storage, save intermediate results to avoid memory buildup
-            if use_temp_storage:
-                self.update_status("Using temporary storage for large diarization data...", percent=0.83)
-                temp_file = os.path.join(cache_dir, f"diarization_map_{int(time.time())}.json")
-                
-                # Process in chunks to avoid memory buildup
-                processed = 0
-                segment_chunk = []
-                
-                for segment, _, speaker in self.diarization.itertracks(yield_label=True):
-                    # Skip very short segments
-                    if segment.duration < 0.5:
-                        continue
-                        
-                    segment_chunk.append({
-                        "start": segment.start,
-                        "end": segment.end,
-                        "speaker": speaker
-                    })
-                    
-                    processed += 1
-                    
-                    # When chunk is full, process it
-                    if len(segment_chunk) >= chunk_size:
-                        timeline_segments.extend(segment_chunk)
-                        # Save intermediate results
-                        with open(temp_file, 'w') as f:
-                            json.dump(timeline_segments, f)
-                        # Clear memory
-                        timeline_segments = []
-                        segment_chunk = []
-                        # Update progress
-                        progress = 0.83 + (processed / segment_count) * 0.05
-                        self.update_status(f"Processed {processed}/{segment_count} diarization segments...", percent=progress)
-                
-                # Process remaining segments
-                if segment_chunk:
-                    timeline_segments.extend(segment_chunk)
-                    with open(temp_file, 'w') as f:
-                        json.dump(timeline_segments, f)
-                
-                # Load from file to continue processing
-                with open(temp_file, 'r') as f:
-                    timeline_segments = json.load(f)
-            else:
-                # For smaller files, process all at once
-                for segment, _, speaker in self.diarization.itertracks(yield_label=True):
-                    # Skip very short segments
-                    if segment.duration < 0.5:
-                        continue
-                        
-                    timeline_segments.append({
-                        "start": segment.start,
-                        "end": segment.end,
-                        "speaker": speaker
-                    })
-            
-            self.update_status("Matching words to speaker segments...", percent=0.89)
-            
-            # OPTIMIZATION 3: Optimize word-to-speaker mapping for long files
-            # Sort segments by start time for faster searching
-            timeline_segments.sort(key=lambda x: x["start"])
-            
-            # Initialize paragraph mapping structures
-            paragraph_speaker_counts = [{} for _ in paragraphs]
-            
-            # Batch process words to reduce computation
-            batch_size = 500
-            num_words = len(self.word_by_word)
-            
-            # Calculate which paragraph each word belongs to
-            word_paragraphs = {}
-            
-            para_start_idx = 0
-            for i, word_info in enumerate(self.word_by_word):
-                if not hasattr(word_info, "start") or not hasattr(word_info, "end"):
-                    continue
-                    
-                # Binary search to find the paragraph for this word
-                # This is much faster than iterating through all paragraphs for each word
-                word = word_info.word.lower()
-                
-                # Find paragraph for this word only once
-                if i % 100 == 0:  # Only update progress occasionally
-                    progress = 0.89 + (i / num_words) * 0.05
-                    self.update_status(f"Matching words to paragraphs ({i}/{num_words})...", percent=progress)
-                
-                # Find which paragraph this word belongs to
-                found_para = False
-                for p_idx in range(para_start_idx, len(paragraphs)):
-                    if word in paragraphs[p_idx].lower():
-                        word_paragraphs[word] = p_idx
-                        para_start_idx = p_idx  # Optimization: start next search from here
-                        found_para = True
-                        break
-                
-                if not found_para:
-                    # If we didn't find it moving forward, try searching all paragraphs
-                    for p_idx in range(len(paragraphs)):
-                        if word in paragraphs[p_idx].lower():
-                            word_paragraphs[word] = p_idx
-                            para_start_idx = p_idx
-                            found_para = True
-                            break
-            
-            # Process words in batches to assign speakers efficiently
-            for batch_start in range(0, num_words, batch_size):
-                batch_end = min(batch_start + batch_size, num_words)
-                
-                for i in range(batch_start, batch_end):
-                    if i >= len(self.word_by_word):
-                        break
-                        
-                    word_info = self.word_by_word[i]
-                    if not hasattr(word_info, "start") or not hasattr(word_info, "end"):
-                        continue
-                    
-                    word = word_info.word.lower()
-                    word_time = (word_info.start + word_info.end) / 2
-                    
-                    # Find segment for this word using binary search for speed
-                    left, right = 0, len(timeline_segments) - 1
-                    segment_idx = -1
-                    
-                    while left <= right:
-                        mid = (left + right) // 2
-                        if timeline_segments[mid]["start"] <= word_time <= timeline_segments[mid]["end"]:
-                            segment_idx = mid
-                            break
-                        elif word_time < timeline_segments[mid]["start"]:
-                            right = mid - 1
-                        else:
-                            left = mid + 1
-                    
-                    # If we found a segment, update the paragraph speaker counts
-                    if segment_idx != -1:
-                        speaker = timeline_segments[segment_idx]["speaker"]
-                        
-                        # If we know which paragraph this word belongs to, update its speaker count
-                        if word in word_paragraphs:
-                            para_idx = word_paragraphs[word]
-                            paragraph_speaker_counts[para_idx][speaker] = paragraph_speaker_counts[para_idx].get(speaker, 0) + 1
-                
-                # Update progress
-                progress = 0.94 + (batch_end / num_words) * 0.05
-                self.update_status(f"Processed {batch_end}/{num_words} words...", percent=progress)
+            num_speakers = len(set(speaker for _, _, speaker in turns))
+            self.update_status(f"Matching {len(timeline)} words to {num_speakers} speakers...", percent=0.9)
             
-            # Assign speakers to paragraphs based on majority vote
-            self.speakers = []
-            for i, paragraph in enumerate(paragraphs):
-                # Get speaker counts for this paragraph
-                speaker_counts = paragraph_speaker_counts[i]
-                
-                # Assign the most common speaker, or default if none
-                if speaker_counts:
-                    # Find speaker with highest count
-                    most_common_speaker = max(speaker_counts.items(), key=lambda x: x[1])[0]
-                    speaker_id = f"Speaker {most_common_speaker.split('_')[-1]}"
-                else:
-                    # Default speaker if no match found
-                    speaker_id = f"Speaker 1"
-                
-                self.speakers.append({
-                    "speaker": speaker_id,
-                    "text": paragraph
-                })
+            labels = timeline.assign_speakers(turns)
+            self.speakers = [
+                {"speaker": f"Speaker {speaker.split('_')[-1]}" if speaker else "Speaker 1", "text": text}
+                for speaker, text in timeline.group_by_speaker(labels)
+            ]
+            self.speaker_segments = [paragraph["text"] for paragraph in self.speakers]
             
             # Quick consistency check
             if len(self.speakers) > 2:
                 self._quick_consistency_check()
             
-            # Clean up temp file if used
-            if use_temp_storage and os.path.exists(temp_file):
-                try:
-                    os.unlink(temp_file)
-                except:
-                    pass
-            
             self.update_status(f"Diarization mapping complete. Found {num_speakers} speakers.", percent=1.0)
             return self.speakers
             
@@ -3027,7 +6215,8 @@ class LLMProcessor:
         
         try:
             self.update_status("Generating response...", percent=0)
-            response = self.client.chat.completions.create(
+            response = openai_scheduler.call(
+                self.client.chat.completions.create,
                 model=model,
                 messages=messages,
                 temperature=temperature
@@ -3088,7 +6277,8 @@ class LLMProcessor:
         prompt += f"\n\nTranscript:\n{transcript}"
         
         try:
-            response = self.client.chat.completions.create(
+            response = openai_scheduler.call(
+                self.client.chat.completions.create,
                 model=self.config_manager.get_model(),
                 messages=[
                     {"role": "system", "content": "You are an assistant that specializes in summarizing transcripts."},
@@ -3135,6 +6325,18 @@ class ConfigManager:
             "model": "gpt-4o",
             "temperature": 0.7,
             "language": "en",
+            "trim_silence": True,
+            "batch_concurrency": BATCH_TRANSCRIBE_CONCURRENCY,
+            "transcription_backend": "openai",
+            "local_whisper_model": LOCAL_WHISPER_MODEL,
+            "openai_requests_per_minute": OPENAI_REQUESTS_PER_MINUTE,
+            "openai_max_concurrency": OPENAI_MAX_CONCURRENCY,
+            "diarization_idle_seconds": DIARIZATION_PIPELINE_IDLE_SECONDS,
+            "diarization_cpu_mode": True,
+            "diarization_intra_op_threads": DIARIZATION_CPU_INTRA_OP_THREADS,
+            "diarization_inter_op_threads": DIARIZATION_CPU_INTER_OP_THREADS,
+            "diarization_two_speaker_fast": False,
+            "diarization_onnx": False,
             "templates": {
                 "Standard Summary": "Please create a concise summary of the following transcript. Identify key points, decisions, and action items if present.",
                 "Meeting Notes": "Please analyze this meeting transcript and create structured notes with these sections: 1) Attendees, 2) Key Discussion Points, 3) Decisions Made, 4) Action Items with Owners, 5) Next Steps",
@@ -3237,6 +6439,108 @@ class ConfigManager:
         self.config["language"] = language
         return self.save_config()
     
+    def get_trim_silence(self):
+        """Get whether long silences are cut out before transcription."""
+        return self.config.get("trim_silence", True)
+    
+    def set_trim_silence(self, enabled):
+        """Set whether long silences are cut out before transcription."""
+        self.config["trim_silence"] = bool(enabled)
+        return self.save_config()
+    
+    def get_batch_concurrency(self):
+        """Get the number of simultaneous requests used for batch transcription."""
+        return self.config.get("batch_concurrency", BATCH_TRANSCRIBE_CONCURRENCY)
+    
+    def set_batch_concurrency(self, concurrency):
+        """Set the number of simultaneous requests used for batch transcription."""
+        try:
+            self.config["batch_concurrency"] = max(1, int(concurrency))
+            return self.save_config()
+        except (TypeError, ValueError):
+            return False
+    
+    def get_transcription_backend(self):
+        """Get the transcription engine name ("openai" or "local")."""
+        return self.config.get("transcription_backend", "openai")
+    
+    def set_transcription_backend(self, name):
+        """Set the transcription engine name ("openai" or "local")."""
+        self.config["transcription_backend"] = name
+        return self.save_config()
+    
+    def get_local_whisper_model(self):
+        """Get the Hugging Face model used for local transcription."""
+        return self.config.get("local_whisper_model", LOCAL_WHISPER_MODEL)
+    
+    def get_rate_limits(self):
+        """Get the OpenAI request rate (per minute) and concurrency ceiling."""
+        return (
+            self.config.get("openai_requests_per_minute", OPENAI_REQUESTS_PER_MINUTE),
+            self.config.get("openai_max_concurrency", OPENAI_MAX_CONCURRENCY)
+        )
+    
+    def set_rate_limits(self, requests_per_minute, max_concurrency):
+        """Set the OpenAI request rate (per minute) and concurrency ceiling."""
+        try:
+            self.config["openai_requests_per_minute"] = max(1, int(requests_per_minute))
+            self.config["openai_max_concurrency"] = max(1, int(max_concurrency))
+            openai_scheduler.configure(*self.get_rate_limits())
+            return self.save_config()
+        except (TypeError, ValueError):
+            return False
+    
+    def get_diarization_idle_seconds(self):
+        """Get how long an unused diarization pipeline stays in memory."""
+        return self.config.get("diarization_idle_seconds", DIARIZATION_PIPELINE_IDLE_SECONDS)
+    
+    def set_diarization_idle_seconds(self, seconds):
+        """Set how long an unused diarization pipeline stays in memory."""
+        try:
+            self.config["diarization_idle_seconds"] = max(1, int(seconds))
+            diarization_pipelines.configure(self.config["diarization_idle_seconds"])
+            return self.save_config()
+        except (TypeError, ValueError):
+            return False
+    
+    def get_cpu_inference_settings(self):
+        """Get whether the diarization CPU mode is on and its intra- and inter-op thread counts."""
+        return (
+            self.config.get("diarization_cpu_mode", True),
+            self.config.get("diarization_intra_op_threads", DIARIZATION_CPU_INTRA_OP_THREADS),
+            self.config.get("diarization_inter_op_threads", DIARIZATION_CPU_INTER_OP_THREADS)
+        )
+    
+    def set_cpu_inference_settings(self, enabled, intra_op_threads, inter_op_threads):
+        """Turn the diarization CPU mode on or off and set its intra- and inter-op thread counts."""
+        try:
+            self.config["diarization_cpu_mode"] = bool(enabled)
+            self.config["diarization_intra_op_threads"] = max(0, int(intra_op_threads))
+            self.config["diarization_inter_op_threads"] = max(0, int(inter_op_threads))
+            diarization_pipelines.configure_cpu(*self.get_cpu_inference_settings())
+            return self.save_config()
+        except (TypeError, ValueError):
+            return False
+    
+    def get_two_speaker_fast_mode(self):
+        """Get whether speakers are always identified with the two-speaker fast mode."""
+        return self.config.get("diarization_two_speaker_fast", False)
+    
+    def set_two_speaker_fast_mode(self, enabled):
+        """Turn the two-speaker fast mode on or off for every diarization."""
+        self.config["diarization_two_speaker_fast"] = bool(enabled)
+        return self.save_config()
+    
+    def get_diarization_onnx(self):
+        """Get whether diarization models run through ONNX Runtime."""
+        return self.config.get("diarization_onnx", False)
+    
+    def set_diarization_onnx(self, enabled):
+        """Run diarization models through ONNX Runtime or through torch."""
+        self.config["diarization_onnx"] = bool(enabled)
+        diarization_pipelines.configure_onnx(self.config["diarization_onnx"])
+        return self.save_config()
+    
     def get_templates(self):
         """Get all templates."""
         return self.config.get("templates", {})
@@ -3262,6 +6566,10 @@ class ConfigManager:
         return False
 
 if __name__ == "__main__":
+    # Needed by the diarization worker processes in frozen app bundles
+    import multiprocessing
+    multiprocessing.freeze_support()
+    
     try:
         print("Starting Audio Processing App...")
         
@@ -3306,6 +6614,16 @@ if __name__ == "__main__":
         import time
         time.sleep(0.5)
         
+        # One-time export of the diarization models for ONNX Runtime: main.py --export-onnx [model]
+        if "--export-onnx" in sys.argv:
+            if not (PYANNOTE_AVAILABLE and DIARIZATION_AVAILABLE and ONNXRUNTIME_AVAILABLE):
+                print("Exporting requires pyannote.audio, onnx and onnxruntime. Install with: pip install pyannote.audio onnx onnxruntime")
+                sys.exit(1)
+            arguments = sys.argv[sys.argv.index("--export-onnx") + 1:]
+            export_model = arguments[0] if arguments else "pyannote/speaker-diarization@2.1"
+            exported = export_diarization_onnx(export_model, ConfigManager(APP_BASE_DIR).get_pyannote_token())
+            sys.exit(0 if exported else 1)
+        
         # Create and start the application
         app = MainApp()
         app.MainLoop()